@@ -1,69 +1,319 @@
 from __future__ import annotations
+import asyncio
 import logging
+import time
+from typing import TYPE_CHECKING, Callable
+import aiohttp
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant
+from homeassistant.util.ssl import get_default_context
 
 from .const import (
     DOMAIN,
     PLATFORMS,
     CONF_TOKEN,
     CONF_DEVICE_ID,
+    CONF_DEVICE_IDS,
+    CONF_DEVICES,
     CONF_SCAN_INTERVAL,
     CONF_STALE_AFTER_S,
     CONF_COOLDOWN_AFTER_429_S,
+    CONF_IMPORT_STATISTICS,
+    CONF_EVENT_KEYS,
+    CONF_BASE_URL,
+    CONF_RECORD_PATH,
+    CONF_WRITE_THROTTLE,
+    CONF_EXTRA_TOKENS,
     DEFAULT_SCAN_INTERVAL,
     DEFAULT_STALE_AFTER_S,
     DEFAULT_COOLDOWN_AFTER_429_S,
+    DEFAULT_IMPORT_STATISTICS,
+    DEFAULT_EVENT_KEYS,
+    DEFAULT_RECORD_PATH,
+    DEFAULT_WRITE_THROTTLE,
 )
-from .coordinator import STCoordinator
+from .api import (
+    BREAKER_ACCOUNT_THRESHOLD,
+    SMARTTHINGS_BASE,
+    STApiClient,
+    STCircuitBreaker,
+    STConnectionStats,
+    create_session,
+    device_capability_refs,
+    device_meta,
+)
+from .capability_cache import STCapabilityCache
+from .coordinator import STCoordinator, STEntryRuntime
+from .discovery import capability_signature, platforms_for
+
+if TYPE_CHECKING:
+    from .playback import STTraceRecorder
 
 _LOGGER = logging.getLogger(__name__)
 
+DATA_SESSION = "_session"
+DATA_SESSION_STATS = "_session_stats"
+DATA_SESSION_USERS = "_session_users"
+DATA_BREAKERS = "_breakers"
+DATA_CAPABILITIES = "_capabilities"
+
+
+def _account_breaker(hass: HomeAssistant, token: str) -> STCircuitBreaker:
+    """Breaker per konto (token) – wspólny dla wszystkich wpisów z tym samym PAT."""
+    breakers: dict[str, STCircuitBreaker] = hass.data[DOMAIN].setdefault(DATA_BREAKERS, {})
+    key = token.strip().lower().removeprefix("bearer ").strip()
+    if key not in breakers:
+        breakers[key] = STCircuitBreaker(f"account …{key[-4:]}", BREAKER_ACCOUNT_THRESHOLD)
+    return breakers[key]
+
+
+def _async_get_session(hass: HomeAssistant) -> aiohttp.ClientSession:
+    """Jedna sesja HTTP (pula keep-alive do api.smartthings.com) współdzielona przez wszystkie wpisy."""
+    store = hass.data[DOMAIN]
+    session: aiohttp.ClientSession | None = store.get(DATA_SESSION)
+    if session is None or session.closed:
+        stats = STConnectionStats()
+        session = create_session(ssl_context=get_default_context(), stats=stats)
+        store[DATA_SESSION] = session
+        store[DATA_SESSION_STATS] = stats
+        store[DATA_SESSION_USERS] = 0
+
+        async def _close(_event: Event) -> None:
+            if not session.closed:
+                await session.close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _close)
+    store[DATA_SESSION_USERS] = store.get(DATA_SESSION_USERS, 0) + 1
+    return session
+
+
+async def _async_release_session(hass: HomeAssistant) -> None:
+    store = hass.data.get(DOMAIN) or {}
+    users = store.get(DATA_SESSION_USERS, 0) - 1
+    store[DATA_SESSION_USERS] = max(0, users)
+    if users <= 0:
+        session: aiohttp.ClientSession | None = store.pop(DATA_SESSION, None)
+        store.pop(DATA_SESSION_STATS, None)
+        if session is not None and not session.closed:
+            await session.close()
+
 
 async def async_setup(hass: HomeAssistant, config) -> bool:
     return True
 
 
+def _recorder(hass: HomeAssistant, entry: ConfigEntry) -> STTraceRecorder | None:
+    """Tryb record: ślady zapytań do pliku JSONL (ścieżka względna → katalog konfiguracji HA)."""
+    path = str(entry.options.get(CONF_RECORD_PATH, DEFAULT_RECORD_PATH)).strip()
+    if not path:
+        return None
+    from .playback import STTraceRecorder
+
+    _LOGGER.info("Recording SmartThings request/response traces to %s", hass.config.path(path))
+    return STTraceRecorder(hass.config.path(path))
+
+
+def _entry_device_ids(entry: ConfigEntry) -> list[str]:
+    """Urządzenia wpisu; starsze wpisy mają pojedynczy device_id."""
+    ids = entry.data.get(CONF_DEVICE_IDS)
+    if ids:
+        return list(ids)
+    return [entry.data[CONF_DEVICE_ID]]
+
+
+def _entry_tokens(entry: ConfigEntry) -> list[str]:
+    """Główny token wpisu + dodatkowe PAT (krok reconfigure, zapisane w entry.data)."""
+    return [entry.data[CONF_TOKEN]] + list(entry.data.get(CONF_EXTRA_TOKENS) or [])
+
+
+def _device_gone(err: BaseException) -> bool:
+    """403/404 w łańcuchu przyczyn (ConfigEntryNotReady ← UpdateFailed ← ClientResponseError)."""
+    cause: BaseException | None = err
+    for _ in range(5):
+        if cause is None:
+            break
+        if isinstance(cause, aiohttp.ClientResponseError) and cause.status in (403, 404):
+            return True
+        cause = cause.__cause__ or cause.__context__
+    return False
+
+
+def _needed_platforms(runtime: STEntryRuntime) -> set:
+    needed: set = set()
+    for coord in runtime.coordinators.values():
+        needed |= platforms_for(coord.data, coord.attribute_type)
+    return needed
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data.setdefault(DOMAIN, {})
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+
+    def _mark(phase: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[phase] = round((now - since) * 1000.0, 1)
+        return now
 
     token = entry.data[CONF_TOKEN]
-    device_id = entry.data[CONF_DEVICE_ID]
+    device_ids = _entry_device_ids(entry)
 
     scan = int(entry.options.get(CONF_SCAN_INTERVAL, entry.data.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)))
     stale = int(entry.options.get(CONF_STALE_AFTER_S, DEFAULT_STALE_AFTER_S))
     cooldown = int(entry.options.get(CONF_COOLDOWN_AFTER_429_S, DEFAULT_COOLDOWN_AFTER_429_S))
+    import_stats = bool(entry.options.get(CONF_IMPORT_STATISTICS, DEFAULT_IMPORT_STATISTICS))
+    event_keys = str(entry.options.get(CONF_EVENT_KEYS, DEFAULT_EVENT_KEYS))
+    write_throttle = str(entry.options.get(CONF_WRITE_THROTTLE, DEFAULT_WRITE_THROTTLE))
+
+    base_url = entry.options.get(CONF_BASE_URL) or entry.data.get(CONF_BASE_URL) or SMARTTHINGS_BASE
+    client = STApiClient(
+        _async_get_session(hass),
+        _entry_tokens(entry),
+        account_breaker=_account_breaker(hass, token),
+        base_url=base_url,
+        recorder=_recorder(hass, entry),
+        token_cooldown_s=cooldown,
+    )
+    runtime = STEntryRuntime(client)
+    hass.data[DOMAIN][entry.entry_id] = runtime
+    t = _mark("init_ms", started)
+
+    # Metadane urządzeń: zapisane w flow, odświeżane jednym wywołaniem /devices
+    metas: dict[str, dict] = dict(entry.data.get(CONF_DEVICES) or {})
+    cap_refs: set[tuple[str, int]] = set()
+    try:
+        for item in await client.list_devices():
+            if item.get("deviceId") in device_ids:
+                metas[item["deviceId"]] = device_meta(item)
+                cap_refs.update(device_capability_refs(item))
+    except Exception as err:
+        _LOGGER.debug("Could not list SmartThings devices, using stored metadata: %s", err)
+    t = _mark("device_list_ms", t)
+
+    capabilities: STCapabilityCache = hass.data[DOMAIN].setdefault(DATA_CAPABILITIES, STCapabilityCache(hass))
 
-    coord = STCoordinator(
-        hass,
-        token=token,
-        device_id=device_id,
-        scan_interval=scan,
-        stale_after_s=stale,
-        cooldown_after_429_s=cooldown,
+    for device_id in device_ids:
+        runtime.coordinators[device_id] = STCoordinator(
+            hass,
+            client=client,
+            session_stats=hass.data[DOMAIN].get(DATA_SESSION_STATS),
+            device_id=device_id,
+            scan_interval=scan,
+            stale_after_s=stale,
+            cooldown_after_429_s=cooldown,
+            import_statistics=import_stats,
+            device_meta=metas.get(device_id),
+            capabilities=capabilities,
+            event_keys=event_keys,
+            write_throttle=write_throttle,
+        )
+
+    # Usunięte/niedostępne urządzenie (403/404) nie blokuje reszty wpisu; inne błędy (5xx, timeout,
+    # 429 przy starcie) → ConfigEntryNotReady i HA ponawia setup całego wpisu
+    results = await asyncio.gather(
+        *(coord.async_config_entry_first_refresh() for coord in runtime.coordinators.values()),
+        return_exceptions=True,
     )
-    hass.data[DOMAIN][entry.entry_id] = coord
+    failed = {
+        device_id: result
+        for device_id, result in zip(list(runtime.coordinators), results)
+        if isinstance(result, BaseException)
+    }
+    retryable = [err for err in failed.values() if not _device_gone(err)]
+    if retryable or len(failed) == len(runtime.coordinators):
+        hass.data[DOMAIN].pop(entry.entry_id, None)
+        await _async_release_session(hass)
+        raise (retryable or list(failed.values()))[0]
+    for device_id, err in failed.items():
+        _LOGGER.warning("Skipping SmartThings device %s (removed or not accessible with this token): %s", device_id, err)
+        runtime.coordinators.pop(device_id)
+    t = _mark("first_refresh_ms", t)
 
-    await coord.async_config_entry_first_refresh()
+    # Definicje capability przed discovery (z dysku; z sieci tylko brakujące/przeterminowane)
+    if not cap_refs:
+        for coord in runtime.coordinators.values():
+            for caps in ((coord.data or {}).get("components") or {}).values():
+                cap_refs.update((cap, 1) for cap in (caps or {}))
+    try:
+        await capabilities.async_ensure(client, cap_refs)
+    except Exception as err:
+        _LOGGER.warning("Loading capability definitions failed, falling back to value sampling: %s", err)
+    t = _mark("capabilities_ms", t)
 
     async def _options_updated(hass: HomeAssistant, updated_entry: ConfigEntry):
         new_scan = int(updated_entry.options.get(CONF_SCAN_INTERVAL, updated_entry.data.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)))
         new_stale = int(updated_entry.options.get(CONF_STALE_AFTER_S, DEFAULT_STALE_AFTER_S))
         new_cooldown = int(updated_entry.options.get(CONF_COOLDOWN_AFTER_429_S, DEFAULT_COOLDOWN_AFTER_429_S))
-        coord.update_options(new_scan, new_stale, new_cooldown)
+        new_import_stats = bool(updated_entry.options.get(CONF_IMPORT_STATISTICS, DEFAULT_IMPORT_STATISTICS))
+        new_event_keys = str(updated_entry.options.get(CONF_EVENT_KEYS, DEFAULT_EVENT_KEYS))
+        new_write_throttle = str(updated_entry.options.get(CONF_WRITE_THROTTLE, DEFAULT_WRITE_THROTTLE))
+        for coord in runtime.coordinators.values():
+            coord.update_options(
+                new_scan, new_stale, new_cooldown, new_import_stats, new_event_keys, new_write_throttle
+            )
+        runtime.client.base_url = (
+            updated_entry.options.get(CONF_BASE_URL) or updated_entry.data.get(CONF_BASE_URL) or SMARTTHINGS_BASE
+        ).rstrip("/")
+        runtime.client.tokens.cooldown_s = float(new_cooldown)
+        old_recorder = runtime.client.recorder
+        runtime.client.recorder = _recorder(hass, updated_entry)
+        if old_recorder is not None:
+            await hass.async_add_executor_job(old_recorder.flush)
         _LOGGER.debug(
-            "st_components options updated: scan=%s stale_after=%s cooldown_429=%s",
-            new_scan, new_stale, new_cooldown
+            "st_components options updated: scan=%s stale_after=%s cooldown_429=%s import_statistics=%s",
+            new_scan, new_stale, new_cooldown, new_import_stats
         )
 
     entry.async_on_unload(entry.add_update_listener(_options_updated))
 
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    # Tylko platformy potrzebne dla bieżącego snapshotu; kolejne dochodzą, gdy pojawią się nowe capability
+    # albo wartości atrybutów zmienią rodzaj (None → liczba/bool)
+    runtime.platforms = {p for p in PLATFORMS if p in _needed_platforms(runtime)}
+
+    def _platform_watcher(coord: STCoordinator) -> Callable[[], None]:
+        """Listener jednego koordynatora: porównuje tylko sygnaturę jego urządzenia (koszt O(atrybuty))."""
+        signature = capability_signature(coord.data)
+
+        def _check_new_platforms() -> None:
+            nonlocal signature
+            if len(runtime.platforms) == len(PLATFORMS):
+                return
+            sig = capability_signature(coord.data)
+            if sig == signature:
+                return
+            signature = sig
+            needed = platforms_for(coord.data, coord.attribute_type)
+            new = [p for p in PLATFORMS if p in needed and p not in runtime.platforms]
+            if new:
+                _LOGGER.info("New capabilities detected on %s, loading platforms %s", coord.device_id, new)
+                runtime.platforms.update(new)
+                hass.async_create_task(hass.config_entries.async_late_forward_entry_setups(entry, new))
+
+        return _check_new_platforms
+
+    for coord in runtime.coordinators.values():
+        entry.async_on_unload(coord.async_add_listener(_platform_watcher(coord)))
+
+    if runtime.platforms:
+        await hass.config_entries.async_forward_entry_setups(entry, [p for p in PLATFORMS if p in runtime.platforms])
+    t = _mark("platforms_ms", t)
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    runtime.setup_timings = timings
+    _LOGGER.info(
+        "st_components setup for %s: %s device(s), platforms %s, %s",
+        entry.title, len(runtime.coordinators), sorted(runtime.platforms), timings,
+    )
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    runtime: STEntryRuntime | None = hass.data[DOMAIN].get(entry.entry_id)
+    platforms = [p for p in PLATFORMS if runtime is None or p in runtime.platforms]
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, platforms)
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
+        if runtime is not None and runtime.client.recorder is not None:
+            await hass.async_add_executor_job(runtime.client.recorder.flush)
+        await _async_release_session(hass)
     return unload_ok
@@ -1,27 +1,428 @@
 
 from __future__ import annotations
+import asyncio
+import logging
+import random
+import ssl
+import time
+from collections import deque
 import aiohttp
-from typing import Any
+from typing import Any, Awaitable, Callable, TypeVar
+
+_LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
 
 SMARTTHINGS_BASE = "https://api.smartthings.com/v1"
 
+# Profil połączeń dla api.smartthings.com (jedna sesja współdzielona przez wszystkie wpisy).
+# Równoległość ogranicza klient: HTTP_LIMIT_PER_TOKEN zapytań na token, bo limity SmartThings są per token.
+HTTP_LIMIT_PER_TOKEN = 4
+HTTP_DNS_TTL_S = 300
+HTTP_KEEPALIVE_S = 60.0
+HTTP_CONNECT_TIMEOUT_S = 5.0
+HTTP_READ_TIMEOUT_S = 15.0
+# Oczekiwanie na wolne połączenie z puli liczone osobno: przy wielu urządzeniach odpytywanych
+# naraz kolejka do puli nie może kończyć się timeoutem (błąd przejściowy → breaker)
+HTTP_POOL_WAIT_S = 60.0
+
+
+class STConnectionStats:
+    """Liczniki ponownego użycia połączeń (z aiohttp TraceConfig)."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": round(self.reuse_ratio, 3),
+        }
+
+
+def create_session(
+    ssl_context: ssl.SSLContext | bool = True,
+    limit_per_host: int = 0,
+    compression: bool = True,
+    stats: STConnectionStats | None = None,
+) -> aiohttp.ClientSession:
+    """Sesja z własnym konektorem: pula per host, cache DNS, keep-alive i rozdzielone timeouty.
+
+    limit_per_host=0 – bez limitu na konektorze; liczbę połączeń wyznaczają klienci (per token).
+    """
+    connector = aiohttp.TCPConnector(
+        limit_per_host=max(0, int(limit_per_host)),
+        ttl_dns_cache=HTTP_DNS_TTL_S,
+        use_dns_cache=True,
+        keepalive_timeout=HTTP_KEEPALIVE_S,
+        enable_cleanup_closed=True,
+        ssl=ssl_context,
+    )
+    trace_configs = []
+    if stats is not None:
+        trace = aiohttp.TraceConfig()
+
+        async def _on_request_start(session, ctx, params):
+            stats.requests += 1
+
+        async def _on_connection_create_end(session, ctx, params):
+            stats.connections_created += 1
+
+        async def _on_connection_reuseconn(session, ctx, params):
+            stats.connections_reused += 1
+
+        trace.on_request_start.append(_on_request_start)
+        trace.on_connection_create_end.append(_on_connection_create_end)
+        trace.on_connection_reuseconn.append(_on_connection_reuseconn)
+        trace_configs.append(trace)
+
+    headers = {"Accept": "application/json"}
+    if compression:
+        headers["Accept-Encoding"] = "gzip, deflate"
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(
+            total=None,
+            connect=HTTP_POOL_WAIT_S + HTTP_CONNECT_TIMEOUT_S,
+            sock_connect=HTTP_CONNECT_TIMEOUT_S,
+            sock_read=HTTP_READ_TIMEOUT_S,
+        ),
+        headers=headers,
+        auto_decompress=True,
+        trace_configs=trace_configs,
+    )
+
+
+# Ponawianie błędów przejściowych (5xx, timeout, zerwane połączenie)
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY_S = 1.0
+RETRY_MAX_DELAY_S = 8.0
+DEFAULT_RETRY_BUDGET_S = 25.0
+
+# Circuit breaker: otwarcie po N kolejnych awariach, próba (half-open) co RESET_S
+BREAKER_DEVICE_THRESHOLD = 3
+BREAKER_ACCOUNT_THRESHOLD = 5
+BREAKER_RESET_S = 300.0
+
+
+class STCircuitOpenError(Exception):
+    """Obwód otwarty – zapytanie nie zostało wysłane."""
+
+
+def is_transient_error(err: Exception) -> bool:
+    if isinstance(err, aiohttp.ClientResponseError):
+        return err.status >= 500
+    return isinstance(err, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ServerDisconnectedError))
+
+
+class STCircuitBreaker:
+    """Prosty breaker: closed → open (po `threshold` awariach) → half-open (jedna próba po `reset_s`)."""
+
+    def __init__(self, name: str, threshold: int, reset_s: float = BREAKER_RESET_S):
+        self.name = name
+        self._threshold = max(1, int(threshold))
+        self._reset_s = float(reset_s)
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self._reset_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing:
+            return False
+        if time.monotonic() - self._opened_at >= self._reset_s:
+            self._probing = True
+            _LOGGER.debug("Circuit %s half-open, probing SmartThings", self.name)
+            return True
+        return False
+
+    def cancel_probe(self) -> None:
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            _LOGGER.info("Circuit %s closed (SmartThings recovered)", self.name)
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or (self._opened_at is None and self._failures >= self._threshold):
+            if self._opened_at is None:
+                _LOGGER.warning(
+                    "Circuit %s opened after %s failures; next probe in %ss",
+                    self.name, self._failures, int(self._reset_s),
+                )
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+TOKEN_COOLDOWN_S = 360.0
+TOKEN_BUDGET_WINDOW_S = 60.0
+
+
+def bearer(token: str) -> str:
+    # Accept "Bearer ..." or raw token; always send Bearer
+    tok = token.strip()
+    if not tok.lower().startswith("bearer "):
+        tok = "Bearer " + tok
+    return tok
+
+
+class _PooledToken:
+    def __init__(self, token: str):
+        self.header = bearer(token)
+        self.label = f"…{self.header[-4:]}"
+        self.cooldown_until = 0.0
+        self.devices: set[str] = set()
+        self._requests: deque[float] = deque()
+        # własny limit równoległości – urządzenia przeniesione z tokenów w cooldownie nie zwiększają go
+        self.slots = asyncio.Semaphore(HTTP_LIMIT_PER_TOKEN)
+
+    def limited(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def note_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def used(self, now: float) -> int:
+        """Liczba zapytań w ostatnim oknie budżetu."""
+        while self._requests and now - self._requests[0] > TOKEN_BUDGET_WINDOW_S:
+            self._requests.popleft()
+        return len(self._requests)
+
+
+class STTokenPool:
+    """Pula PAT jednego konta: shardowanie urządzeń między tokeny i przenoszenie ich przy 429.
+
+    Limity SmartThings liczone są per token, więc każdy dodatkowy token to dodatkowy budżet zapytań.
+    """
+
+    def __init__(self, tokens: list[str], cooldown_s: float = TOKEN_COOLDOWN_S):
+        seen: dict[str, _PooledToken] = {}
+        for tok in tokens:
+            if tok and tok.strip():
+                pooled = _PooledToken(tok)
+                seen.setdefault(pooled.header, pooled)
+        if not seen:
+            raise ValueError("At least one SmartThings token is required")
+        self._tokens = list(seen.values())
+        self._assigned: dict[str, _PooledToken] = {}
+        self.cooldown_s = float(cooldown_s)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _available(self, now: float) -> list[_PooledToken]:
+        return [t for t in self._tokens if not t.limited(now)]
+
+    def has_available(self) -> bool:
+        return bool(self._available(time.monotonic()))
+
+    def token_for(self, device_id: str | None = None) -> _PooledToken:
+        now = time.monotonic()
+        available = self._available(now)
+        if not available:
+            # wszystkie w cooldownie – ten, który najszybciej wróci
+            return min(self._tokens, key=lambda t: t.cooldown_until)
+        if device_id is None:
+            return min(available, key=lambda t: t.used(now))
+
+        current = self._assigned.get(device_id)
+        least = min(available, key=lambda t: (len(t.devices), t.used(now)))
+        if current in available and len(current.devices) <= len(least.devices) + 1:
+            return current
+        if current is not None:
+            current.devices.discard(device_id)
+            _LOGGER.debug(
+                "Device %s moved from token %s to %s (%s)",
+                device_id, current.label, least.label,
+                "rate-limited" if current.limited(now) else "rebalance",
+            )
+        least.devices.add(device_id)
+        self._assigned[device_id] = least
+        return least
+
+    def mark_limited(self, token: _PooledToken, retry_after: str | None = None) -> None:
+        try:
+            wait = float(retry_after) if retry_after else self.cooldown_s
+        except ValueError:
+            wait = self.cooldown_s
+        token.cooldown_until = time.monotonic() + max(1.0, wait)
+        _LOGGER.warning(
+            "SmartThings token %s rate-limited (429); cooling down %ss, %s/%s tokens available",
+            token.label, int(wait), len(self._available(time.monotonic())), len(self._tokens),
+        )
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "token": t.label,
+                "devices": len(t.devices),
+                "requests_last_minute": t.used(now),
+                "cooldown_s": max(0, int(t.cooldown_until - now)),
+            }
+            for t in self._tokens
+        ]
+
+
 class STApiClient:
-    def __init__(self, session: aiohttp.ClientSession, token: str):
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        token: str | list[str],
+        account_breaker: STCircuitBreaker | None = None,
+        base_url: str = SMARTTHINGS_BASE,
+        recorder: Callable[[dict[str, Any]], None] | None = None,
+        token_cooldown_s: float = TOKEN_COOLDOWN_S,
+    ):
         self._session = session
-        # Accept "Bearer ..." or raw token; always send Bearer
-        tok = token.strip()
-        if not tok.lower().startswith("bearer "):
-            tok = "Bearer " + tok
-        self._headers = {"Authorization": tok}
-
-    async def get_status(self, device_id: str) -> dict[str, Any]:
-        url = f"{SMARTTHINGS_BASE}/devices/{device_id}/status"
-        async with self._session.get(url, headers=self._headers, timeout=20) as resp:
-            resp.raise_for_status()
-            return await resp.json()
+        self.base_url = (base_url or SMARTTHINGS_BASE).rstrip("/")
+        # Opcjonalny zapis par zapytanie/odpowiedź (tryb record, patrz playback.py)
+        self.recorder = recorder
+        # Jeden PAT albo pula tokenów, między które dzielimy urządzenia
+        self.tokens = STTokenPool([token] if isinstance(token, str) else list(token), token_cooldown_s)
+        self._account_breaker = account_breaker or STCircuitBreaker("account", BREAKER_ACCOUNT_THRESHOLD)
+        self._device_breakers: dict[str, STCircuitBreaker] = {}
+
+    def device_breaker(self, device_id: str) -> STCircuitBreaker:
+        br = self._device_breakers.get(device_id)
+        if br is None:
+            br = self._device_breakers[device_id] = STCircuitBreaker(f"device {device_id}", BREAKER_DEVICE_THRESHOLD)
+        return br
+
+    async def _guarded(
+        self,
+        device_id: str,
+        call: Callable[[], Awaitable[_T]],
+        budget_s: float | None = None,
+        retries: int = RETRY_MAX_ATTEMPTS,
+    ) -> _T:
+        """Wywołanie przez breakery konta i urządzenia, z ponawianiem (jitter) w ramach budżetu czasu."""
+        device_br = self.device_breaker(device_id)
+        if not device_br.allow():
+            raise STCircuitOpenError(f"circuit {device_br.name} is open")
+        if not self._account_breaker.allow():
+            device_br.cancel_probe()
+            raise STCircuitOpenError(f"circuit {self._account_breaker.name} is open")
+
+        deadline = time.monotonic() + (DEFAULT_RETRY_BUDGET_S if budget_s is None else budget_s)
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                try:
+                    # budżet ogranicza też pojedynczą próbę (razem z czekaniem na slot tokenu)
+                    async with asyncio.timeout(max(0.0, deadline - time.monotonic())):
+                        result = await call()
+                except Exception as err:
+                    if not is_transient_error(err):
+                        if isinstance(err, aiohttp.ClientResponseError):
+                            # 4xx (w tym 429): usługa odpowiada, więc to nie awaria dla breakera
+                            device_br.record_success()
+                            self._account_breaker.record_success()
+                        else:
+                            device_br.cancel_probe()
+                            self._account_breaker.cancel_probe()
+                        raise
+                    delay = random.uniform(0, min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** (attempt - 1)))
+                    if attempt >= retries or time.monotonic() + delay >= deadline:
+                        device_br.record_failure()
+                        self._account_breaker.record_failure()
+                        raise
+                    _LOGGER.debug("Transient SmartThings error (%s), retry %s in %.1fs", err, attempt, delay)
+                    await asyncio.sleep(delay)
+                    continue
+                device_br.record_success()
+                self._account_breaker.record_success()
+                return result
+        except asyncio.CancelledError:
+            # anulowanie (np. reload wpisu) w trakcie próby half-open nie może zablokować breakera na stałe
+            device_br.cancel_probe()
+            self._account_breaker.cancel_probe()
+            raise
+
+    async def _request(self, method: str, url: str, payload: dict | None = None, device_id: str | None = None) -> Any:
+        token = self.tokens.token_for(device_id)
+        # czekanie na slot tokenu jest poza timeoutami aiohttp (ogranicza je budżet w _guarded)
+        async with token.slots:
+            return await self._send(method, url, payload, token)
+
+    async def _send(self, method: str, url: str, payload: dict | None, token: _PooledToken) -> Any:
+        token.note_request()
+        headers = {"Authorization": token.header}
+
+        started = time.time()
+        status: int | None = None
+        body: Any = None
+        try:
+            async with self._session.request(method, url, headers=headers, json=payload) as resp:
+                status = resp.status
+                if status == 429:
+                    self.tokens.mark_limited(token, resp.headers.get("Retry-After"))
+                if self.recorder is None:
+                    resp.raise_for_status()
+                    return await resp.json()
+                try:
+                    body = await resp.json()
+                except Exception:
+                    body = None
+                resp.raise_for_status()
+                return body
+        finally:
+            if self.recorder is not None:
+                try:
+                    self.recorder({
+                        "ts": started,
+                        "method": method,
+                        "path": url[len(self.base_url):] if url.startswith(self.base_url) else url,
+                        "request": payload,
+                        "status": status,
+                        "elapsed_ms": round((time.time() - started) * 1000.0, 1),
+                        "response": body,
+                    })
+                except Exception as err:
+                    _LOGGER.debug("Trace recording failed: %s", err)
+
+    async def list_devices(self) -> list[dict[str, Any]]:
+        """Lista urządzeń konta (GET /devices, z obsługą stronicowania)."""
+        items: list[dict[str, Any]] = []
+        url: str | None = f"{self.base_url}/devices"
+        while url:
+            page = await self._request("GET", url)
+            items.extend(page.get("items") or [])
+            url = ((page.get("_links") or {}).get("next") or {}).get("href")
+        return items
+
+    async def get_capability(self, capability: str, version: int = 1) -> dict[str, Any]:
+        return await self._request("GET", f"{self.base_url}/capabilities/{capability}/{int(version)}")
+
+    async def get_status(self, device_id: str, budget_s: float | None = None) -> dict[str, Any]:
+        url = f"{self.base_url}/devices/{device_id}/status"
+        return await self._guarded(device_id, lambda: self._request("GET", url, device_id=device_id), budget_s)
 
     async def send_command(self, device_id: str, component: str, capability: str, command: str, arguments: list | None = None) -> dict:
-        url = f"{SMARTTHINGS_BASE}/devices/{device_id}/commands"
+        url = f"{self.base_url}/devices/{device_id}/commands"
         payload = {
             "commands": [{
                 "component": component,
@@ -30,6 +431,29 @@ class STApiClient:
                 "arguments": arguments or []
             }]
         }
-        async with self._session.post(url, headers=self._headers, json=payload, timeout=20) as resp:
-            resp.raise_for_status()
-            return await resp.json()
+
+        # komendy bez ponawiania – tylko ochrona breakerem
+        return await self._guarded(
+            device_id, lambda: self._request("POST", url, payload, device_id=device_id), retries=1
+        )
+
+
+def device_meta(item: dict[str, Any]) -> dict[str, Any]:
+    """Metadane urządzenia z pozycji listy /devices (do DeviceInfo)."""
+    ocf = item.get("ocf") or {}
+    return {
+        "name": item.get("label") or item.get("name") or item.get("deviceId"),
+        "manufacturer": ocf.get("manufacturerName") or item.get("manufacturerName") or "SmartThings",
+        "model": ocf.get("modelNumber") or item.get("deviceTypeName") or None,
+        "sw_version": ocf.get("firmwareVersion") or None,
+    }
+
+
+def device_capability_refs(item: dict[str, Any]) -> list[tuple[str, int]]:
+    """Pary (capability, wersja) ze wszystkich komponentów pozycji listy /devices."""
+    refs: list[tuple[str, int]] = []
+    for comp in item.get("components") or []:
+        for cap in comp.get("capabilities") or []:
+            if cap.get("id"):
+                refs.append((cap["id"], int(cap.get("version") or 1)))
+    return refs
@@ -5,7 +5,7 @@ from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .const import DOMAIN
-from .coordinator import STCoordinator
+from .coordinator import STCoordinator, STEntryRuntime
 from .entity import STCEntity
 
 CONTACT_CAP = "contactSensor"
@@ -25,8 +25,7 @@ class STCBinarySensor(STCEntity, BinarySensorEntity):
             return val.lower() in ("on", "open", "detected", "true")
         return bool(val)
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
-    coord: STCoordinator = hass.data[DOMAIN][entry.entry_id]
+def _build_entities(coord: STCoordinator) -> list[BinarySensorEntity]:
     entities: list[BinarySensorEntity] = []
 
     comps = (coord.data or {}).get("components") or {}
@@ -42,11 +41,19 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
         for cap_name, attrs in (caps or {}).items():
             for attr_name, payload in (attrs or {}).items():
                 if isinstance(payload, dict) and "value" in payload:
-                    val = payload.get("value")
-                    if isinstance(val, bool):
+                    kind = coord.attribute_type(cap_name, attr_name)
+                    if kind == "boolean" or (kind is None and isinstance(payload.get("value"), bool)):
                         name = f"ST {comp_id} {cap_name}.{attr_name}"
                         uid = f"{coord.device_id}-{comp_id}-{cap_name}-{attr_name}"
                         entities.append(STCBinarySensor(coord, comp_id, cap_name, attr_name, name, uid))
 
+    return entities
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
+    runtime: STEntryRuntime = hass.data[DOMAIN][entry.entry_id]
+    entities: list[BinarySensorEntity] = []
+    for coord in runtime.coordinators.values():
+        entities.extend(_build_entities(coord))
+
     if entities:
         async_add_entities(entities, update_before_add=True)
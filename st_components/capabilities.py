@@ -0,0 +1,167 @@
+"""Deklaratywna mapa capability/atrybut → device class, state class, jednostka i konwerter.
+
+Tabele są kompilowane raz przy imporcie modułu; encje rozwiązują konwersję w konstruktorze,
+a nie przy każdym odczycie ``native_value``.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any
+
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
+from homeassistant.const import (
+    PERCENTAGE,
+    CONCENTRATION_PARTS_PER_MILLION,
+    LIGHT_LUX,
+    UnitOfElectricCurrent,
+    UnitOfElectricPotential,
+    UnitOfEnergy,
+    UnitOfPower,
+    UnitOfPressure,
+    UnitOfTemperature,
+    UnitOfVolume,
+    UnitOfVolumeFlowRate,
+)
+
+from .energy import ENERGY_KWH_FACTORS, Converter, to_float as _to_float
+
+
+@dataclass(frozen=True)
+class SensorSpec:
+    device_class: SensorDeviceClass | None
+    state_class: SensorStateClass | None
+    native_unit: str | None
+    converter: Converter
+
+
+def _scale(factor: float) -> Converter:
+    if factor == 1.0:
+        return _to_float
+
+    def convert(value: Any) -> float | None:
+        f = _to_float(value)
+        return None if f is None else f * factor
+
+    return convert
+
+
+# ---- jednostki źródłowe (SmartThings) → (jednostka HA, mnożnik) ----
+# Klucze małymi literami; "" oznacza brak jednostki w payloadzie.
+
+_ENERGY_UNITS = {src: (UnitOfEnergy.KILO_WATT_HOUR, factor) for src, factor in ENERGY_KWH_FACTORS.items()}
+_POWER_UNITS = {
+    "": (UnitOfPower.WATT, 1.0),
+    "w": (UnitOfPower.WATT, 1.0),
+    "kw": (UnitOfPower.WATT, 1000.0),
+}
+_TEMPERATURE_UNITS = {
+    "": (UnitOfTemperature.CELSIUS, 1.0),
+    "c": (UnitOfTemperature.CELSIUS, 1.0),
+    "f": (UnitOfTemperature.FAHRENHEIT, 1.0),
+    "k": (UnitOfTemperature.KELVIN, 1.0),
+}
+_PERCENT_UNITS = {
+    "": (PERCENTAGE, 1.0),
+    "%": (PERCENTAGE, 1.0),
+}
+_VOLUME_UNITS = {
+    "l": (UnitOfVolume.LITERS, 1.0),
+    "ml": (UnitOfVolume.MILLILITERS, 1.0),
+    "m3": (UnitOfVolume.CUBIC_METERS, 1.0),
+    "m³": (UnitOfVolume.CUBIC_METERS, 1.0),
+    "gal": (UnitOfVolume.GALLONS, 1.0),
+    "ccf": (UnitOfVolume.CENTUM_CUBIC_FEET, 1.0),
+}
+_FLOW_UNITS = {
+    "": (UnitOfVolumeFlowRate.LITERS_PER_MINUTE, 1.0),
+    "l/min": (UnitOfVolumeFlowRate.LITERS_PER_MINUTE, 1.0),
+    "l/h": (UnitOfVolumeFlowRate.LITERS_PER_MINUTE, 1.0 / 60.0),
+    "m3/h": (UnitOfVolumeFlowRate.CUBIC_METERS_PER_HOUR, 1.0),
+    "m³/h": (UnitOfVolumeFlowRate.CUBIC_METERS_PER_HOUR, 1.0),
+    "gal/min": (UnitOfVolumeFlowRate.GALLONS_PER_MINUTE, 1.0),
+}
+_PRESSURE_UNITS = {
+    "": (UnitOfPressure.KPA, 1.0),
+    "kpa": (UnitOfPressure.KPA, 1.0),
+    "hpa": (UnitOfPressure.HPA, 1.0),
+    "mbar": (UnitOfPressure.MBAR, 1.0),
+    "inhg": (UnitOfPressure.INHG, 1.0),
+}
+
+# ---- rejestr: (capability, attribute, device_class, state_class, jednostki źródłowe) ----
+
+CAPABILITY_REGISTRY: tuple[tuple[str, str, SensorDeviceClass | None, SensorStateClass | None, dict], ...] = (
+    ("temperatureMeasurement", "temperature", SensorDeviceClass.TEMPERATURE, SensorStateClass.MEASUREMENT, _TEMPERATURE_UNITS),
+    ("relativeHumidityMeasurement", "humidity", SensorDeviceClass.HUMIDITY, SensorStateClass.MEASUREMENT, _PERCENT_UNITS),
+    ("battery", "battery", SensorDeviceClass.BATTERY, SensorStateClass.MEASUREMENT, _PERCENT_UNITS),
+    ("audioVolume", "volume", None, SensorStateClass.MEASUREMENT, _PERCENT_UNITS),
+    ("switchLevel", "level", None, SensorStateClass.MEASUREMENT, _PERCENT_UNITS),
+    ("custom.waterFilter", "waterFilterUsage", None, SensorStateClass.MEASUREMENT, _PERCENT_UNITS),
+    ("powerMeter", "power", SensorDeviceClass.POWER, SensorStateClass.MEASUREMENT, _POWER_UNITS),
+    ("energyMeter", "energy", SensorDeviceClass.ENERGY, SensorStateClass.TOTAL_INCREASING, _ENERGY_UNITS),
+    ("flowMeasurement", "flow", SensorDeviceClass.VOLUME_FLOW_RATE, SensorStateClass.MEASUREMENT, _FLOW_UNITS),
+    ("atmosphericPressureMeasurement", "atmosphericPressure", SensorDeviceClass.ATMOSPHERIC_PRESSURE, SensorStateClass.MEASUREMENT, _PRESSURE_UNITS),
+    ("illuminanceMeasurement", "illuminance", SensorDeviceClass.ILLUMINANCE, SensorStateClass.MEASUREMENT, {"": (LIGHT_LUX, 1.0), "lux": (LIGHT_LUX, 1.0)}),
+    ("carbonDioxideMeasurement", "carbonDioxide", SensorDeviceClass.CO2, SensorStateClass.MEASUREMENT, {"": (CONCENTRATION_PARTS_PER_MILLION, 1.0), "ppm": (CONCENTRATION_PARTS_PER_MILLION, 1.0)}),
+    ("voltageMeasurement", "voltage", SensorDeviceClass.VOLTAGE, SensorStateClass.MEASUREMENT, {"": (UnitOfElectricPotential.VOLT, 1.0), "v": (UnitOfElectricPotential.VOLT, 1.0)}),
+    ("currentMeasurement", "current", SensorDeviceClass.CURRENT, SensorStateClass.MEASUREMENT, {"": (UnitOfElectricCurrent.AMPERE, 1.0), "a": (UnitOfElectricCurrent.AMPERE, 1.0)}),
+)
+
+# Gdy capability nie jest w rejestrze, ale payload podaje jednostkę → klasyfikacja po jednostce
+UNIT_FALLBACK: tuple[tuple[SensorDeviceClass | None, SensorStateClass | None, dict], ...] = (
+    (SensorDeviceClass.ENERGY, SensorStateClass.TOTAL_INCREASING, _ENERGY_UNITS),
+    (SensorDeviceClass.POWER, SensorStateClass.MEASUREMENT, {k: v for k, v in _POWER_UNITS.items() if k}),
+    (SensorDeviceClass.TEMPERATURE, SensorStateClass.MEASUREMENT, {k: v for k, v in _TEMPERATURE_UNITS.items() if k}),
+    (SensorDeviceClass.VOLUME, SensorStateClass.TOTAL_INCREASING, _VOLUME_UNITS),
+    (SensorDeviceClass.VOLUME_FLOW_RATE, SensorStateClass.MEASUREMENT, {k: v for k, v in _FLOW_UNITS.items() if k}),
+    (None, SensorStateClass.MEASUREMENT, {"%": (PERCENTAGE, 1.0)}),
+)
+
+# ---- kompilacja (raz, przy imporcie) ----
+
+_BY_ATTR: dict[tuple[str, str], dict[str, SensorSpec]] = {}
+_BY_UNIT: dict[str, SensorSpec] = {}
+
+
+def _compile() -> None:
+    factors: dict[float, Converter] = {}
+
+    def conv(factor: float) -> Converter:
+        if factor not in factors:
+            factors[factor] = _scale(factor)
+        return factors[factor]
+
+    for cap, attr, dclass, sclass, units in CAPABILITY_REGISTRY:
+        _BY_ATTR[(cap, attr)] = {
+            src: SensorSpec(dclass, sclass, native, conv(factor))
+            for src, (native, factor) in units.items()
+        }
+    for dclass, sclass, units in UNIT_FALLBACK:
+        for src, (native, factor) in units.items():
+            _BY_UNIT.setdefault(src, SensorSpec(dclass, sclass, native, conv(factor)))
+
+
+_compile()
+
+RAW_SPEC = SensorSpec(None, None, None, lambda value: value)
+
+
+def _unit_key(unit: str | None) -> str:
+    return (unit or "").strip().lower()
+
+
+def resolve_sensor(capability: str, attribute: str, unit: str | None) -> SensorSpec | None:
+    """Zwróć spec dla (capability, attribute) i jednostki z payloadu; None gdy nieznane."""
+    key = _unit_key(unit)
+    by_unit = _BY_ATTR.get((capability, attribute))
+    if by_unit is not None:
+        # "" tylko gdy payload nie podaje jednostki
+        spec = by_unit.get(key)
+        if spec is not None:
+            return spec
+        # znana capability, ale nieznana jednostka – zostaw liczbę bez przeliczania;
+        # bez device class, bo HA odrzuca jednostki spoza listy danej klasy
+        any_spec = next(iter(by_unit.values()))
+        return SensorSpec(None, any_spec.state_class, unit, _to_float)
+    if key:
+        return _BY_UNIT.get(key)
+    return None
@@ -0,0 +1,152 @@
+"""Cache definicji capability SmartThings (/capabilities/{id}/{version}) zapisywany na dysku z TTL."""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Any, Iterable
+
+from aiohttp import ClientResponseError
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .api import HTTP_LIMIT_PER_TOKEN, STApiClient
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.capabilities"
+
+CAPABILITY_TTL_S = 7 * 24 * 3600
+# Nieudane pobranie (np. capability prywatna) też zapamiętujemy, ale krócej
+CAPABILITY_MISS_TTL_S = 24 * 3600
+
+_TRUE = ("true", "on", "yes", "1")
+_FALSE = ("false", "off", "no", "0")
+
+
+def _key(capability: str, version: int) -> str:
+    return f"{capability}/{int(version)}"
+
+
+def _version(key: str) -> int:
+    return int(key.rsplit("/", 1)[1])
+
+
+def _compact(definition: dict[str, Any]) -> dict[str, Any]:
+    """Zostaw z definicji tylko to, czego używa discovery: typ/enum/jednostkę wartości i listę komend."""
+    attrs: dict[str, Any] = {}
+    for name, spec in (definition.get("attributes") or {}).items():
+        props = ((spec or {}).get("schema") or {}).get("properties") or {}
+        value = props.get("value") or {}
+        unit = props.get("unit") or {}
+        attrs[name] = {
+            "type": value.get("type"),
+            "enum": value.get("enum"),
+            "unit": unit.get("default") or (unit.get("enum") or [None])[0],
+        }
+    return {"attributes": attrs, "commands": sorted((definition.get("commands") or {}).keys())}
+
+
+class STCapabilityCache:
+    """Definicje capability współdzielone przez wszystkie urządzenia i wpisy."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._store: Store[dict[str, Any]] = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._defs: dict[str, dict[str, Any]] = {}
+        # capability → klucz najwyższej wersji z definicją (status urządzenia nie niesie wersji)
+        self._by_id: dict[str, str] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        stored = await self._store.async_load() or {}
+        for key, entry in (stored.get("definitions") or {}).items():
+            self._defs[key] = entry
+            if entry.get("definition") is not None:
+                self._index(key)
+
+    def _index(self, key: str) -> None:
+        """Zapamiętaj wersję, jeśli jest nowsza – niezależnie od kolejności wczytania/pobrania."""
+        cap = key.rsplit("/", 1)[0]
+        current = self._by_id.get(cap)
+        if current is None or _version(key) > _version(current):
+            self._by_id[cap] = key
+
+    def _fresh(self, key: str, now: float) -> bool:
+        entry = self._defs.get(key)
+        if entry is None:
+            return False
+        ttl = CAPABILITY_TTL_S if entry.get("definition") is not None else CAPABILITY_MISS_TTL_S
+        return now - float(entry.get("fetched_at", 0)) < ttl
+
+    async def async_ensure(self, client: STApiClient, refs: Iterable[tuple[str, int]]) -> None:
+        """Pobierz brakujące/przeterminowane definicje (równolegle, z limitem) i zapisz raz na dysk."""
+        async with self._lock:
+            await self.async_load()
+            now = time.time()
+            missing = sorted({(cap, int(ver)) for cap, ver in refs if not self._fresh(_key(cap, ver), now)})
+            if not missing:
+                return
+            sem = asyncio.Semaphore(HTTP_LIMIT_PER_TOKEN)
+
+            async def _fetch(cap: str, ver: int) -> None:
+                async with sem:
+                    try:
+                        definition = _compact(await client.get_capability(cap, ver))
+                    except ClientResponseError as err:
+                        if err.status not in (403, 404):
+                            # 429/5xx przy starcie – bez zapisu, ponowimy przy następnym setupie
+                            _LOGGER.debug("Capability %s/%s fetch failed, will retry: %s", cap, ver, err)
+                            return
+                        _LOGGER.debug("Capability %s/%s not available: %s", cap, ver, err)
+                        definition = None
+                    except Exception as err:
+                        _LOGGER.debug("Capability %s/%s fetch failed, will retry: %s", cap, ver, err)
+                        return
+                key = _key(cap, ver)
+                self._defs[key] = {"fetched_at": now, "definition": definition}
+                if definition is not None:
+                    self._index(key)
+
+            await asyncio.gather(*(_fetch(cap, ver) for cap, ver in missing))
+            _LOGGER.debug("Fetched %s capability definitions", len(missing))
+            await self._store.async_save({"definitions": self._defs})
+
+    # ===== Odczyt schematu =====
+    def attribute(self, capability: str, attribute: str) -> dict[str, Any] | None:
+        key = self._by_id.get(capability)
+        if key is None:
+            return None
+        definition = self._defs[key].get("definition") or {}
+        return (definition.get("attributes") or {}).get(attribute)
+
+    def attribute_type(self, capability: str, attribute: str) -> str | None:
+        return (self.attribute(capability, attribute) or {}).get("type")
+
+    def commands(self, capability: str) -> list[str]:
+        key = self._by_id.get(capability)
+        if key is None:
+            return []
+        return list((self._defs[key].get("definition") or {}).get("commands") or [])
+
+    def coerce(self, capability: str, attribute: str, value: Any) -> Any:
+        """Dopasuj wartość do typu ze schematu (np. "12.5" → 12.5, "true" → True)."""
+        kind = self.attribute_type(capability, attribute)
+        if value is None or kind is None:
+            return value
+        if kind in ("number", "integer") and isinstance(value, str):
+            try:
+                return int(value) if kind == "integer" else float(value)
+            except ValueError:
+                return None
+        if kind == "boolean" and isinstance(value, str):
+            low = value.lower()
+            if low in _TRUE:
+                return True
+            if low in _FALSE:
+                return False
+        return value
@@ -1,22 +1,43 @@
 """Config flow for SmartThings Components integration."""
 from __future__ import annotations
 
+import logging
+from typing import Any
+
 import voluptuous as vol
+from aiohttp import ClientResponseError
 from homeassistant import config_entries
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 from .const import (
     DOMAIN,
     CONF_TOKEN,
     CONF_DEVICE_ID,
+    CONF_DEVICE_IDS,
+    CONF_DEVICES,
     CONF_SCAN_INTERVAL,
     CONF_STALE_AFTER_S,
     CONF_COOLDOWN_AFTER_429_S,
+    CONF_IMPORT_STATISTICS,
+    CONF_EVENT_KEYS,
+    CONF_BASE_URL,
+    CONF_RECORD_PATH,
+    CONF_WRITE_THROTTLE,
+    CONF_EXTRA_TOKENS,
     DEFAULT_SCAN_INTERVAL,
     DEFAULT_STALE_AFTER_S,
     DEFAULT_COOLDOWN_AFTER_429_S,
+    DEFAULT_IMPORT_STATISTICS,
+    DEFAULT_EVENT_KEYS,
+    DEFAULT_RECORD_PATH,
+    DEFAULT_WRITE_THROTTLE,
 )
+from .api import SMARTTHINGS_BASE, STApiClient, device_meta
+
+_LOGGER = logging.getLogger(__name__)
 
 
 class STConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -24,31 +45,133 @@ class STConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    def __init__(self) -> None:
+        self._token: str | None = None
+        self._base_url: str = SMARTTHINGS_BASE
+        self._scan_interval: int = DEFAULT_SCAN_INTERVAL
+        self._devices: dict[str, dict[str, Any]] = {}
+
+    def _configured_device_ids(self) -> set[str]:
+        """Urządzenia z istniejących wpisów; starsze wpisy mają pojedynczy device_id."""
+        configured: set[str] = set()
+        for entry in self._async_current_entries():
+            configured.update(entry.data.get(CONF_DEVICE_IDS) or [entry.data.get(CONF_DEVICE_ID)])
+        return configured
+
     async def async_step_user(self, user_input=None) -> FlowResult:
         errors: dict[str, str] = {}
 
         if user_input is not None:
             token = user_input[CONF_TOKEN].strip()
-            device_id = user_input[CONF_DEVICE_ID].strip()
-            scan_interval = int(user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL))
+            self._scan_interval = int(user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL))
+            self._base_url = str(user_input.get(CONF_BASE_URL) or SMARTTHINGS_BASE).strip().rstrip("/")
+            client = STApiClient(async_get_clientsession(self.hass), token, base_url=self._base_url)
+            try:
+                items = await client.list_devices()
+            except ClientResponseError as err:
+                errors["base"] = "invalid_auth" if err.status in (401, 403) else "cannot_connect"
+            except Exception as err:
+                _LOGGER.debug("Listing SmartThings devices failed: %s", err)
+                errors["base"] = "cannot_connect"
+            else:
+                self._token = token
+                listed = {item["deviceId"]: device_meta(item) for item in items if item.get("deviceId")}
+                # urządzenie może należeć tylko do jednego wpisu (unique_id encji, podwójne odpytywanie)
+                configured = self._configured_device_ids()
+                self._devices = {dev: meta for dev, meta in listed.items() if dev not in configured}
+                if not listed:
+                    errors["base"] = "no_devices"
+                elif not self._devices:
+                    return self.async_abort(reason="already_configured")
+                else:
+                    return await self.async_step_devices()
+
+        fields = {
+            vol.Required(CONF_TOKEN): str,
+            vol.Optional(CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL): int,
+        }
+        if self.show_advanced_options:
+            # np. serwer playback (python -m st_components.playback) do testów offline
+            fields[vol.Optional(CONF_BASE_URL, default=SMARTTHINGS_BASE)] = str
+        data_schema = vol.Schema(fields)
+        return self.async_show_form(step_id="user", data_schema=data_schema, errors=errors)
 
-            return self.async_create_entry(
-                title=f"ST device {device_id}",
-                data={
-                    CONF_TOKEN: token,
-                    CONF_DEVICE_ID: device_id,
-                    CONF_SCAN_INTERVAL: scan_interval,
-                },
-            )
+    async def async_step_devices(self, user_input=None) -> FlowResult:
+        """Wybór wielu urządzeń z konta do jednego wpisu (jeden klient i jeden token)."""
+        errors: dict[str, str] = {}
 
-        data_schema = vol.Schema(
-            {
-                vol.Required(CONF_TOKEN): str,
-                vol.Required(CONF_DEVICE_ID): str,
-                vol.Optional(CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL): int,
-            }
+        if user_input is not None:
+            device_ids = list(user_input.get(CONF_DEVICE_IDS) or [])
+            if not device_ids:
+                errors["base"] = "no_devices_selected"
+            elif self._configured_device_ids() & set(device_ids):
+                # inny flow dodał te urządzenia w międzyczasie
+                return self.async_abort(reason="already_configured")
+            else:
+                await self.async_set_unique_id(",".join(sorted(device_ids)))
+                self._abort_if_unique_id_configured()
+                if len(device_ids) == 1:
+                    title = f"ST {self._devices[device_ids[0]]['name']}"
+                else:
+                    title = f"ST account ({len(device_ids)} devices)"
+                return self.async_create_entry(
+                    title=title,
+                    data={
+                        CONF_TOKEN: self._token,
+                        CONF_DEVICE_IDS: device_ids,
+                        CONF_DEVICES: {dev: self._devices[dev] for dev in device_ids},
+                        CONF_SCAN_INTERVAL: self._scan_interval,
+                        CONF_BASE_URL: self._base_url,
+                    },
+                )
+
+        options = {
+            dev: f"{meta['name']} ({meta['model']})" if meta.get("model") else meta["name"]
+            for dev, meta in self._devices.items()
+        }
+        data_schema = vol.Schema({vol.Required(CONF_DEVICE_IDS): cv.multi_select(options)})
+        return self.async_show_form(step_id="devices", data_schema=data_schema, errors=errors)
+
+    async def async_step_reconfigure(self, user_input=None) -> FlowResult:
+        """Dodatkowe PAT tego samego konta (więcej budżetu zapytań); trzymane w entry.data, nie w opcjach."""
+        entry = self.hass.config_entries.async_get_entry(self.context["entry_id"])
+        errors: dict[str, str] = {}
+
+        if user_input is not None:
+            text = str(user_input.get(CONF_EXTRA_TOKENS) or "")
+            tokens = [t.strip() for t in text.replace("\n", ",").split(",") if t.strip()]
+            base_url = entry.options.get(CONF_BASE_URL) or entry.data.get(CONF_BASE_URL) or SMARTTHINGS_BASE
+            session = async_get_clientsession(self.hass)
+            # token musi widzieć wszystkie urządzenia wpisu – inaczej przypisane mu urządzenia dostaną 403
+            device_ids = set(entry.data.get(CONF_DEVICE_IDS) or [entry.data.get(CONF_DEVICE_ID)])
+            for tok in tokens:
+                try:
+                    items = await STApiClient(session, tok, base_url=base_url).list_devices()
+                    if not device_ids <= {item.get("deviceId") for item in items}:
+                        errors["base"] = "token_missing_devices"
+                        break
+                except ClientResponseError as err:
+                    errors["base"] = "invalid_auth" if err.status in (401, 403) else "cannot_connect"
+                    break
+                except Exception as err:
+                    _LOGGER.debug("Checking extra SmartThings token failed: %s", err)
+                    errors["base"] = "cannot_connect"
+                    break
+            if not errors:
+                # pusty formularz usuwa dodatkowe tokeny; wpis przeładuje się z nową pulą
+                return self.async_update_reload_and_abort(
+                    entry,
+                    data={**entry.data, CONF_EXTRA_TOKENS: tokens},
+                    reason="reconfigure_successful",
+                )
+
+        # istniejących tokenów nie pokazujemy w formularzu – tylko ich liczbę
+        return self.async_show_form(
+            step_id="reconfigure",
+            data_schema=vol.Schema({vol.Optional(CONF_EXTRA_TOKENS): str}),
+            errors=errors,
+            description_placeholders={"count": str(len(entry.data.get(CONF_EXTRA_TOKENS) or []))},
         )
-        return self.async_show_form(step_id="user", data_schema=data_schema, errors=errors)
 
     @staticmethod
     @callback
@@ -74,6 +197,11 @@ class STOpsFlowHandler(config_entries.OptionsFlow):
                     CONF_COOLDOWN_AFTER_429_S: int(
                         user_input.get(CONF_COOLDOWN_AFTER_429_S, DEFAULT_COOLDOWN_AFTER_429_S)
                     ),
+                    CONF_IMPORT_STATISTICS: bool(user_input.get(CONF_IMPORT_STATISTICS, DEFAULT_IMPORT_STATISTICS)),
+                    CONF_EVENT_KEYS: str(user_input.get(CONF_EVENT_KEYS, DEFAULT_EVENT_KEYS)).strip(),
+                    CONF_BASE_URL: str(user_input.get(CONF_BASE_URL) or SMARTTHINGS_BASE).strip().rstrip("/"),
+                    CONF_RECORD_PATH: str(user_input.get(CONF_RECORD_PATH, DEFAULT_RECORD_PATH)).strip(),
+                    CONF_WRITE_THROTTLE: str(user_input.get(CONF_WRITE_THROTTLE, DEFAULT_WRITE_THROTTLE)).strip(),
                 },
             )
 
@@ -91,6 +219,26 @@ class STOpsFlowHandler(config_entries.OptionsFlow):
                     CONF_COOLDOWN_AFTER_429_S,
                     default=entry.options.get(CONF_COOLDOWN_AFTER_429_S, DEFAULT_COOLDOWN_AFTER_429_S),
                 ): int,
+                vol.Optional(
+                    CONF_IMPORT_STATISTICS,
+                    default=entry.options.get(CONF_IMPORT_STATISTICS, DEFAULT_IMPORT_STATISTICS),
+                ): bool,
+                vol.Optional(
+                    CONF_EVENT_KEYS,
+                    default=entry.options.get(CONF_EVENT_KEYS, DEFAULT_EVENT_KEYS),
+                ): str,
+                vol.Optional(
+                    CONF_BASE_URL,
+                    default=entry.options.get(CONF_BASE_URL, entry.data.get(CONF_BASE_URL, SMARTTHINGS_BASE)),
+                ): str,
+                vol.Optional(
+                    CONF_RECORD_PATH,
+                    default=entry.options.get(CONF_RECORD_PATH, DEFAULT_RECORD_PATH),
+                ): str,
+                vol.Optional(
+                    CONF_WRITE_THROTTLE,
+                    default=entry.options.get(CONF_WRITE_THROTTLE, DEFAULT_WRITE_THROTTLE),
+                ): str,
             }
         )
         return self.async_show_form(step_id="init", data_schema=data_schema)
@@ -4,13 +4,34 @@ DOMAIN = "st_components"
 
 CONF_TOKEN = "token"
 CONF_DEVICE_ID = "device_id"
+CONF_DEVICE_IDS = "device_ids"
+CONF_DEVICES = "devices"
 CONF_SCAN_INTERVAL = "scan_interval"
 CONF_STALE_AFTER_S = "stale_after_s"
 CONF_COOLDOWN_AFTER_429_S = "cooldown_after_429_s"
+CONF_IMPORT_STATISTICS = "import_statistics"
+CONF_EVENT_KEYS = "event_keys"
+CONF_BASE_URL = "base_url"
+CONF_RECORD_PATH = "record_path"
+CONF_WRITE_THROTTLE = "write_throttle"
+# Dodatkowe PAT (lista w entry.data, ustawiane krokiem reconfigure – nie w opcjach)
+CONF_EXTRA_TOKENS = "extra_tokens"
 
 DEFAULT_SCAN_INTERVAL = 30
 DEFAULT_STALE_AFTER_S = 180
 DEFAULT_COOLDOWN_AFTER_429_S = 360
+DEFAULT_IMPORT_STATISTICS = True
+DEFAULT_EVENT_KEYS = ""
+DEFAULT_RECORD_PATH = ""
+# capability:min_interval_s:abs_delta:rel_delta:max_age_s
+DEFAULT_WRITE_THROTTLE = (
+    "powerMeter:30:1:0.02:300, "
+    "powerConsumptionReport:30:0:0:300, "
+    "temperatureMeasurement:60:0.2:0:900"
+)
+
+# Zdarzenie HA dla zmian atrybutów wskazanych w opcji event_keys
+EVENT_ATTRIBUTE_CHANGED = f"{DOMAIN}_attribute_changed"
 
 PLATFORMS: list[Platform] = [
     Platform.SENSOR,
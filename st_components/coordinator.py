@@ -1,18 +1,43 @@
 from __future__ import annotations
 from datetime import timedelta, datetime, timezone
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 import logging
 import json
 from aiohttp import ClientResponseError
 
-from homeassistant.core import HomeAssistant
+from homeassistant.const import Platform
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
-from .api import STApiClient
+from .api import (
+    DEFAULT_RETRY_BUDGET_S,
+    STApiClient,
+    STCircuitOpenError,
+    STConnectionStats,
+    is_transient_error,
+)
+from .capability_cache import STCapabilityCache
+from .const import EVENT_ATTRIBUTE_CHANGED
+from .energy import EnergyConverter
+from .throttle import WritePolicy, parse_policies
+from .subscriptions import (
+    AttributeKey,
+    ChangeCallback,
+    STAttributeChange,
+    STSubscriptions,
+    matches,
+    parse_key,
+)
+
+if TYPE_CHECKING:
+    # statistics ciągnie moduły recordera – import dopiero gdy snapshot ma PCR (patrz _stats_writer)
+    from .statistics import STStatisticsWriter
 
 _LOGGER = logging.getLogger(__name__)
 
+# Jak długo (s) wolno serwować ostatni dobry snapshot podczas awarii SmartThings
+STALE_SNAPSHOT_MAX_AGE_S = 3600
+
 
 def _trim(obj: Any, limit: int = 800) -> str:
     """Zamień obiekt na krótki string do logów debug."""
@@ -40,35 +65,77 @@ class STCoordinator(DataUpdateCoordinator[dict[str, Any]]):
     def __init__(
         self,
         hass: HomeAssistant,
-        token: str,
+        client: STApiClient,
         device_id: str,
         scan_interval: int,
         stale_after_s: int,
         cooldown_after_429_s: int,
+        import_statistics: bool = True,
+        session_stats: STConnectionStats | None = None,
+        device_meta: dict[str, Any] | None = None,
+        capabilities: STCapabilityCache | None = None,
+        event_keys: str = "",
+        write_throttle: str = "",
     ):
         base = max(5, int(scan_interval))
         super().__init__(
             hass,
             _LOGGER,
-            name="st_components",
+            name=f"st_components {device_id}",
             update_interval=timedelta(seconds=base),
         )
         self._device_id = device_id
-        self._client = STApiClient(async_get_clientsession(hass), token)
+        self._client = client
+        self._device_meta: dict[str, Any] = dict(device_meta or {})
+        self.capabilities = capabilities
+        self._session_stats = session_stats
 
         self._base_interval = timedelta(seconds=base)
         self._cooldown_until: datetime | None = None
         self._stale_after_s = int(stale_after_s)
         self._cooldown_after_429_s = int(cooldown_after_429_s)
 
+        # Ostatni udany odczyt /status; przy awarii serwujemy go jako "stale"
+        self._last_success_at: datetime | None = None
+        self._stale = False
+
+        # Konwertery energii per (komponent, capability) – jedna decyzja Wh/kWh dla encji i statystyk
+        self._energy_converters: dict[tuple[str, str], EnergyConverter] = {}
+
+        # Godzinowe statystyki długoterminowe z PCR (import paczkami do recordera); writer i moduły
+        # recordera ładujemy dopiero, gdy snapshot faktycznie ma powerConsumptionReport
+        self._import_statistics = bool(import_statistics)
+        self._stats: STStatisticsWriter | None = None
+
+        # Subskrypcje zmian pojedynczych atrybutów + klucze publikowane na szynę HA
+        self._subscriptions = STSubscriptions()
+        self._event_keys: list[AttributeKey] = self._parse_event_keys(event_keys)
+        self._pending_changes: list[STAttributeChange] = []
+
+        # Polityki ograniczania zapisów stanu encji (per capability)
+        self._write_policies: dict[str, WritePolicy] = parse_policies(write_throttle)
+
         # Gdy wykryjemy deltaEnergy w PCR → blokujemy refresh (by nie resetować sesji energii)
         self._refresh_blocked_due_to_delta = False
 
     # ===== Live options =====
-    def update_options(self, scan_interval: int, stale_after_s: int, cooldown_after_429_s: int) -> None:
+    def update_options(
+        self,
+        scan_interval: int,
+        stale_after_s: int,
+        cooldown_after_429_s: int,
+        import_statistics: bool = True,
+        event_keys: str = "",
+        write_throttle: str = "",
+    ) -> None:
+        self._event_keys = self._parse_event_keys(event_keys)
+        self._write_policies = parse_policies(write_throttle)
         self._base_interval = timedelta(seconds=max(5, int(scan_interval)))
         self._stale_after_s = int(stale_after_s)
         self._cooldown_after_429_s = int(cooldown_after_429_s)
+        self._import_statistics = bool(import_statistics)
+        if not import_statistics:
+            self._stats = None
         if not self._in_cooldown():
             self.update_interval = self._base_interval
         _LOGGER.info(
@@ -76,6 +143,59 @@ class STCoordinator(DataUpdateCoordinator[dict[str, Any]]):
             int(self._base_interval.total_seconds()), self._stale_after_s, self._cooldown_after_429_s
         )
 
+    def _stats_writer(self, data: dict[str, Any] | None) -> STStatisticsWriter | None:
+        if self._stats is None and self._import_statistics and "recorder" in self.hass.config.components:
+            comps = (data or {}).get("components") or {}
+            if any("powerConsumptionReport" in (caps or {}) for caps in comps.values()):
+                from .statistics import STStatisticsWriter
+
+                self._stats = STStatisticsWriter(self.hass, self._device_id, self.energy_converter)
+        return self._stats
+
+    # ===== Subscriptions =====
+    @staticmethod
+    def _parse_event_keys(text: str) -> list[AttributeKey]:
+        keys: list[AttributeKey] = []
+        for part in (text or "").replace("\n", ",").split(","):
+            if not part.strip():
+                continue
+            key = parse_key(part)
+            if key is None:
+                _LOGGER.warning("Ignoring invalid event key %r (expected component/capability/attribute)", part)
+            else:
+                keys.append(key)
+        return keys
+
+    @callback
+    def async_subscribe(self, key: AttributeKey | str, change_callback: ChangeCallback) -> Callable[[], None]:
+        """Obserwuj (component, capability, attribute); dozwolone wzorce fnmatch. Zwraca funkcję wypisania."""
+        if isinstance(key, str):
+            parsed = parse_key(key)
+            if parsed is None:
+                raise ValueError(f"Invalid attribute key: {key!r}")
+            key = parsed
+        return self._subscriptions.subscribe(key, change_callback)
+
+    def _collect_changes(self, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+        # pierwszy snapshot to stan początkowy, nie zmiana
+        if not old or (not self._subscriptions and not self._event_keys):
+            return
+        self._pending_changes = self._subscriptions.diff(
+            self._device_id, old, new, datetime.now(timezone.utc), extra_patterns=self._event_keys
+        )
+
+    @callback
+    def async_update_listeners(self) -> None:
+        super().async_update_listeners()
+        changes, self._pending_changes = self._pending_changes, []
+        if not changes:
+            return
+        self._subscriptions.dispatch(changes)
+        if self._event_keys:
+            for change in changes:
+                if matches(change.key, self._event_keys):
+                    self.hass.bus.async_fire(EVENT_ATTRIBUTE_CHANGED, change.as_event_data())
+
     # ===== Cooldown helpers =====
     def _in_cooldown(self) -> bool:
         return self._cooldown_until is not None and datetime.now(timezone.utc) < self._cooldown_until
@@ -151,7 +271,8 @@ class STCoordinator(DataUpdateCoordinator[dict[str, Any]]):
         await self._maybe_refresh(prev_end_ts)
 
         try:
-            data = await self._client.get_status(self._device_id)
+            budget_s = min(DEFAULT_RETRY_BUDGET_S, 0.8 * self.update_interval.total_seconds())
+            data = await self._client.get_status(self._device_id, budget_s=budget_s)
 
             comps = (data or {}).get("components", {}) or {}
             main = comps.get("main", {}) or {}
@@ -183,24 +304,107 @@ class STCoordinator(DataUpdateCoordinator[dict[str, Any]]):
                 "ST /status snapshot | PCR last=%s | energyMeter=%s | powerMeter=%s",
                 _trim(last_pcr), _trim(em), _trim(pm),
             )
+            if self._session_stats is not None:
+                _LOGGER.debug("ST HTTP connections: %s", self._session_stats.as_dict())
 
             # sukces → spróbuj wyjść z cooldownu i przywrócić interwał
             self._exit_cooldown_if_needed()
+            self._last_success_at = datetime.now(timezone.utc)
+            if self._stale:
+                _LOGGER.info("SmartThings /status for %s recovered, snapshot is fresh again", self._device_id)
+                self._stale = False
+
+            self._collect_changes(prev, data)
+
+            stats = self._stats_writer(data)
+            if stats is not None:
+                try:
+                    await stats.async_process(data or {})
+                except Exception as err:
+                    _LOGGER.warning("Importing PCR statistics failed for %s: %s", self._device_id, err)
+
             return data or {}
 
+        except STCircuitOpenError as err:
+            return self._stale_or_fail(err)
+
         except ClientResponseError as err:
             if err.status == 429:
+                if self._client.tokens.has_available():
+                    # inny token z puli przejmie urządzenie przy następnym odpytaniu
+                    return self._stale_or_fail(err)
                 self._enter_cooldown()
+            elif is_transient_error(err):
+                return self._stale_or_fail(err)
             _LOGGER.error("Error fetching st_components data: %s", err)
             raise UpdateFailed(str(err)) from err
 
         except Exception as err:
+            if is_transient_error(err):
+                return self._stale_or_fail(err)
             _LOGGER.warning("SmartThings /status failed for %s: %s", self._device_id, err)
             raise UpdateFailed(str(err)) from err
 
+    def _stale_or_fail(self, err: Exception) -> dict[str, Any]:
+        """Podczas awarii zwróć ostatni dobry snapshot (oznaczony jako stale), o ile nie jest zbyt stary."""
+        if self.data and self._last_success_at is not None:
+            age_s = (datetime.now(timezone.utc) - self._last_success_at).total_seconds()
+            if age_s <= STALE_SNAPSHOT_MAX_AGE_S:
+                if not self._stale:
+                    _LOGGER.warning(
+                        "SmartThings /status unavailable for %s (%s); serving last snapshot as stale",
+                        self._device_id, err,
+                    )
+                self._stale = True
+                return self.data
+        _LOGGER.warning("SmartThings /status failed for %s: %s", self._device_id, err)
+        raise UpdateFailed(str(err)) from err
+
     @property
     def device_id(self) -> str:
         return self._device_id
 
+    @property
+    def device_meta(self) -> dict[str, Any]:
+        return self._device_meta
+
+    def write_policy(self, capability: str) -> WritePolicy | None:
+        return self._write_policies.get(capability)
+
+    def attribute_type(self, capability: str, attribute: str) -> str | None:
+        """Typ wartości atrybutu wg definicji capability (number/integer/boolean/string/…), None gdy brak."""
+        return self.capabilities.attribute_type(capability, attribute) if self.capabilities is not None else None
+
+    @property
+    def is_stale(self) -> bool:
+        return self._stale
+
+    @property
+    def connection_stats(self) -> dict[str, Any]:
+        return self._session_stats.as_dict() if self._session_stats is not None else {}
+
+    def energy_converter(self, component: str, capability: str, attribute: str) -> EnergyConverter:
+        key = (component, capability)
+        conv = self._energy_converters.get(key)
+        if conv is None:
+            attr = self.capabilities.attribute(capability, attribute) if self.capabilities is not None else None
+            conv = self._energy_converters[key] = EnergyConverter((attr or {}).get("unit"))
+        return conv
+
+    @property
+    def token_stats(self) -> list[dict[str, Any]]:
+        return self._client.tokens.stats()
+
     async def command(self, component: str, capability: str, command: str, arguments=None) -> dict:
         return await self._client.send_command(self._device_id, component, capability, command, arguments or [])
+
+
+class STEntryRuntime:
+    """Stan wpisu konfiguracji: jeden klient API (konto) i koordynator per urządzenie."""
+
+    def __init__(self, client: STApiClient):
+        self.client = client
+        self.coordinators: dict[str, STCoordinator] = {}
+        # Platformy faktycznie przekazane do HA i czasy faz setupu (ms)
+        self.platforms: set[Platform] = set()
+        self.setup_timings: dict[str, float] = {}
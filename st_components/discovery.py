@@ -0,0 +1,63 @@
+"""Lekki test, które platformy są potrzebne dla snapshotu (bez importu modułów platform)."""
+from __future__ import annotations
+from typing import Any, Callable
+
+from homeassistant.const import Platform
+
+# Te same reguły co async_setup_entry w sensor/binary_sensor/number/switch
+_SENSOR_KEYS = {
+    ("temperatureMeasurement", "temperature"),
+    ("powerConsumptionReport", "powerConsumption"),
+    ("energyMeter", "energy"),
+    ("powerMeter", "power"),
+}
+_SETPOINT = ("thermostatCoolingSetpoint", "coolingSetpoint")
+_CONTACT = ("contactSensor", "contact")
+
+
+def _value_kind(payload: Any) -> str | None:
+    value = payload.get("value") if isinstance(payload, dict) else None
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    return None
+
+
+def capability_signature(data: dict[str, Any] | None) -> frozenset[tuple[str, str, str, str | None]]:
+    """Zbiór (component, capability, attribute, rodzaj wartości) – tani test, czy zmienił się skład
+    urządzenia albo typ wartości (np. atrybut z None przy starcie staje się liczbą bez definicji capability)."""
+    return frozenset(
+        (comp, cap, attr, _value_kind(payload))
+        for comp, caps in ((data or {}).get("components") or {}).items()
+        for cap, attrs in (caps or {}).items()
+        for attr, payload in (attrs or {}).items()
+    )
+
+
+def platforms_for(
+    data: dict[str, Any] | None,
+    attribute_type: Callable[[str, str], str | None],
+) -> set[Platform]:
+    needed: set[Platform] = set()
+    for caps in ((data or {}).get("components") or {}).values():
+        for cap, attrs in (caps or {}).items():
+            attrs = attrs or {}
+            if cap == _SETPOINT[0] and _SETPOINT[1] in attrs:
+                needed.add(Platform.NUMBER)
+            if cap == _CONTACT[0] and _CONTACT[1] in attrs:
+                needed.add(Platform.BINARY_SENSOR)
+            if cap.endswith("powerCool") or cap.endswith("powerFreeze"):
+                needed.add(Platform.SWITCH)
+            for attr, payload in attrs.items():
+                if not isinstance(payload, dict) or "value" not in payload:
+                    continue
+                kind = attribute_type(cap, attr)
+                val = payload.get("value")
+                if (cap, attr) in _SENSOR_KEYS or kind in ("number", "integer") or (
+                    kind is None and isinstance(val, (int, float))
+                ):
+                    needed.add(Platform.SENSOR)
+                if kind == "boolean" or (kind is None and isinstance(val, bool)):
+                    needed.add(Platform.BINARY_SENSOR)
+    return needed
@@ -0,0 +1,100 @@
+"""Przeliczanie energii do kWh i parsowanie rekordów powerConsumptionReport.
+
+Moduł bez importów Home Assistant – koordynator, encje sensor i statystyki dzielą go bez
+ładowania platformy sensor ani recordera.
+"""
+from __future__ import annotations
+from typing import Any, Callable
+
+Converter = Callable[[Any], Any]
+
+# Jednostka źródłowa (małymi literami) → mnożnik do kWh
+ENERGY_KWH_FACTORS: dict[str, float] = {
+    "kwh": 1.0,
+    "kilo_watt_hour": 1.0,
+    "kilowatt-hour": 1.0,
+    "kilowatt_hour": 1.0,
+    "wh": 0.001,
+    "watt-hour": 0.001,
+    "watt_hour": 0.001,
+    "watt hours": 0.001,
+    "watt_hours": 0.001,
+}
+
+# Bez jednostki: wartości powyżej progu to zwykle Wh
+_WH_GUESS_ABOVE = 500
+
+
+def to_float(value: Any) -> float | None:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _from_wh(value: Any) -> float | None:
+    f = to_float(value)
+    return None if f is None else f * 0.001
+
+
+def _energy_decision(unit: str | None, sample: Any) -> tuple[Converter, bool]:
+    """(konwerter do kWh, czy decyzja jest ostateczna) dla jednostki i próbki."""
+    key = (unit or "").strip().lower()
+    if key in ENERGY_KWH_FACTORS:
+        return (to_float if ENERGY_KWH_FACTORS[key] == 1.0 else _from_wh, True)
+    if unit:
+        # coś innego niż Wh/kWh – zwracamy bez zmian
+        return (to_float, True)
+    f = to_float(sample)
+    if f is not None and f > _WH_GUESS_ABOVE:
+        return (_from_wh, True)
+    # mała wartość bez jednostki: może to być kWh albo Wh tuż po resecie – sprawdzamy dalej
+    return (to_float, False)
+
+
+class EnergyConverter:
+    """Konwerter do kWh dla jednej serii energii, wspólny dla encji i statystyk.
+
+    Jednostka z payloadu albo ze schematu capability rozstrzyga od razu. Bez niej stosujemy
+    heurystykę (duże wartości to zwykle Wh), ponawianą przy każdej próbce, dopóki któraś
+    nie będzie jednoznaczna.
+    """
+
+    def __init__(self, schema_unit: str | None = None):
+        self._schema_unit = schema_unit
+        self._unit: str | None = None
+        self._convert: Converter = to_float
+        self._decided = False
+
+    def __call__(self, value: Any, unit: str | None = None) -> float | None:
+        unit = unit or self._schema_unit
+        if unit != self._unit:
+            self._unit = unit
+            self._decided = False
+        if not self._decided:
+            self._convert, self._decided = _energy_decision(unit, value)
+        return self._convert(value)
+
+
+def last_pcr_record(value: Any) -> dict | None:
+    """Ostatni rekord z powerConsumptionReport.powerConsumption (dict albo list[dict])."""
+    if isinstance(value, list) and value:
+        value = value[-1]
+    return value if isinstance(value, dict) else None
+
+
+def parse_pcr(value: Any, energy_conv: EnergyConverter) -> tuple[float | None, float | None]:
+    """(energy_kWh, power_W) z ostatniego rekordu PCR.
+
+    energy_conv: konwerter serii (wspólny dla encji i statystyk), więc decyzja Wh/kWh się nie rozjeżdża.
+    """
+    last = last_pcr_record(value)
+    if last is None:
+        return (None, None)
+    # ST bywa niespójne – sprawdzamy pola unit jeśli są
+    energy_val = to_float(last.get("energy"))
+    energy_unit = last.get("energyUnit") or last.get("unit") or last.get("energy_unit") or None
+    energy_kwh = energy_conv(energy_val, energy_unit) if energy_val is not None else None
+    return (energy_kwh, to_float(last.get("power")))
@@ -1,11 +1,16 @@
 
 from __future__ import annotations
+import time
 from typing import Any
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.helpers.device_registry import DeviceInfo
 from .const import DOMAIN
 from .coordinator import STCoordinator
 
+_UNSET = object()
+
 class STCEntity(CoordinatorEntity[STCoordinator]):
     _attr_should_poll = False
 
@@ -16,6 +21,63 @@ class STCEntity(CoordinatorEntity[STCoordinator]):
         self._attribute = attribute
         self._attr_name = name
         self._attr_unique_id = unique_id
+        # Ograniczanie zapisów (polityka per capability z opcji write_throttle)
+        self._written_value: Any = _UNSET
+        self._written_flags: tuple[bool, bool] | None = None
+        self._written_at: float | None = None
+        self._pending_write = None
+
+    async def async_will_remove_from_hass(self) -> None:
+        if self._pending_write is not None:
+            self._pending_write()
+            self._pending_write = None
+        await super().async_will_remove_from_hass()
+
+    def _throttle_value(self) -> Any:
+        """Wartość porównywana przez martwą strefę: native_value (sensor/number) albo is_on."""
+        value = getattr(self, "native_value", _UNSET)
+        return getattr(self, "is_on", None) if value is _UNSET else value
+
+    def _write_now(self, value: Any) -> None:
+        if self._pending_write is not None:
+            self._pending_write()
+            self._pending_write = None
+        self._written_value = value
+        self._written_flags = (self.available, self.coordinator.is_stale)
+        self._written_at = time.monotonic()
+        self.async_write_ha_state()
+
+    @callback
+    def _write_deferred(self, _now) -> None:
+        self._pending_write = None
+        self._write_now(self._throttle_value())
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        policy = self.coordinator.write_policy(self._capability)
+        value = self._throttle_value()
+        if (
+            policy is None
+            or self._written_at is None
+            or self._written_flags != (self.available, self.coordinator.is_stale)
+        ):
+            self._write_now(value)
+            return
+
+        age = time.monotonic() - self._written_at
+        if policy.max_age_s and age >= policy.max_age_s:
+            self._write_now(value)
+            return
+        if not policy.significant(self._written_value, value):
+            return
+        if age < policy.min_interval_s:
+            # zbyt wcześnie – jeden zaległy zapis na koniec okna (ostatnia wartość wygrywa)
+            if self._pending_write is None:
+                self._pending_write = async_call_later(
+                    self.hass, policy.min_interval_s - age, self._write_deferred
+                )
+            return
+        self._write_now(value)
 
     @property
     def extra_state_attributes(self):
@@ -23,14 +85,18 @@ class STCEntity(CoordinatorEntity[STCoordinator]):
             "st_component": self._component_id,
             "st_capability": self._capability,
             "st_attribute": self._attribute,
+            "st_stale": self.coordinator.is_stale,
         }
 
     @property
     def device_info(self) -> DeviceInfo:
+        meta = self.coordinator.device_meta
         return DeviceInfo(
             identifiers={(DOMAIN, self.coordinator.device_id)},
-            name="SmartThings Device",
-            manufacturer="SmartThings",
+            name=meta.get("name") or "SmartThings Device",
+            manufacturer=meta.get("manufacturer") or "SmartThings",
+            model=meta.get("model"),
+            sw_version=meta.get("sw_version"),
         )
 
     def _current_attr(self) -> Any:
@@ -39,7 +105,9 @@ class STCEntity(CoordinatorEntity[STCoordinator]):
         comp = comps.get(self._component_id) or {}
         cap = comp.get(self._capability) or {}
         attr = cap.get(self._attribute) or {}
-        return attr.get("value")
+        value = attr.get("value")
+        schema = self.coordinator.capabilities
+        return schema.coerce(self._capability, self._attribute, value) if schema is not None else value
 
     async def _send(self, capability: str, command: str, arguments=None):
         await self.coordinator.command(self._component_id, capability, command, arguments or [])
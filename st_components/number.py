@@ -5,7 +5,7 @@ from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .const import DOMAIN
-from .coordinator import STCoordinator
+from .coordinator import STCoordinator, STEntryRuntime
 from .entity import STCEntity
 
 CAP = "thermostatCoolingSetpoint"
@@ -42,8 +42,7 @@ class STCSetpointNumber(STCEntity, NumberEntity):
     async def async_set_native_value(self, value: float) -> None:
         await self._send(CAP, "setCoolingSetpoint", [value])
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
-    coord: STCoordinator = hass.data[DOMAIN][entry.entry_id]
+def _build_entities(coord: STCoordinator) -> list[NumberEntity]:
     entities: list[NumberEntity] = []
     comps = (coord.data or {}).get("components") or {}
 
@@ -53,5 +52,13 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
             uid = f"{coord.device_id}-{comp_id}-{CAP}-{ATTR}"
             entities.append(STCSetpointNumber(coord, comp_id, CAP, ATTR, name, uid))
 
+    return entities
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
+    runtime: STEntryRuntime = hass.data[DOMAIN][entry.entry_id]
+    entities: list[NumberEntity] = []
+    for coord in runtime.coordinators.values():
+        entities.extend(_build_entities(coord))
+
     if entities:
         async_add_entities(entities, update_before_add=True)
@@ -0,0 +1,218 @@
+"""Zapis (record) i odtwarzanie (playback) ruchu SmartThings do testów obciążeniowych offline.
+
+Nagrywanie: ustaw opcję ``record_path`` – każde zapytanie STApiClient trafia jako linia JSON do pliku.
+Odtwarzanie: uruchom serwer i ustaw opcję ``base_url`` na jego adres, np.::
+
+    python -m st_components.playback traces.jsonl --port 8765 --speed 10 --clones 200 --rate-429 0.02
+
+a w integracji ``base_url = http://127.0.0.1:8765/v1``.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+from aiohttp import web
+
+_LOGGER = logging.getLogger(__name__)
+
+# Separator identyfikatora klonu: "<device_id>~<n>" odtwarza nagranie urządzenia <device_id>
+CLONE_SEP = "~"
+
+
+class STTraceRecorder:
+    """Dopisuje ślady zapytań do pliku JSONL; zapis na dysk poza pętlą zdarzeń (wątek w tle)."""
+
+    def __init__(self, path: str, flush_every: int = 20):
+        self._path = path
+        self._flush_every = max(1, int(flush_every))
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def __call__(self, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self._buffer.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+            full = len(self._buffer) >= self._flush_every
+        if full:
+            threading.Thread(target=self.flush, daemon=True).start()
+
+    def flush(self) -> None:
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        # kolejność paczek może się przestawić między wątkami – load_traces sortuje po "ts"
+        with self._write_lock, open(self._path, "a", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+
+
+def load_traces(path: str) -> list[dict[str, Any]]:
+    traces: list[dict[str, Any]] = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                traces.append(json.loads(line))
+    traces.sort(key=lambda t: t.get("ts", 0))
+    return traces
+
+
+def _split_clone(device_id: str) -> str:
+    return device_id.split(CLONE_SEP, 1)[0]
+
+
+class STPlaybackServer:
+    """Serwer HTTP odtwarzający nagrane odpowiedzi w tempie 1x lub przyspieszonym, z wstrzykiwaniem błędów."""
+
+    def __init__(
+        self,
+        traces: list[dict[str, Any]],
+        speed: float = 1.0,
+        clones: int = 0,
+        rate_429: float = 0.0,
+        error_rate: float = 0.0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        seed: int | None = None,
+    ):
+        self._speed = max(0.001, float(speed))
+        self._clones = max(0, int(clones))
+        self._rate_429 = float(rate_429)
+        self._error_rate = float(error_rate)
+        self._latency_s = float(latency_ms) / 1000.0
+        self._jitter_s = float(jitter_ms) / 1000.0
+        self._rng = random.Random(seed)
+        self.stats: Counter[str] = Counter()
+
+        t0 = traces[0]["ts"] if traces else 0.0
+        self._duration = max(1.0, (traces[-1]["ts"] - t0) if traces else 1.0)
+        # (method, path) → posortowane offsety i odpowiedzi
+        self._index: dict[tuple[str, str], tuple[list[float], list[dict[str, Any]]]] = {}
+        for t in traces:
+            if t.get("status") is None:
+                continue
+            offsets, entries = self._index.setdefault((t["method"], t["path"]), ([], []))
+            offsets.append(t["ts"] - t0)
+            entries.append(t)
+        self._device_ids = sorted({
+            p.split("/")[2] for (_m, p) in self._index if p.startswith("/devices/") and p.count("/") >= 3
+        })
+        self._started = time.monotonic()
+
+    def _offset(self) -> float:
+        """Pozycja w nagraniu (s), zapętlona po jego końcu."""
+        return ((time.monotonic() - self._started) * self._speed) % self._duration
+
+    def _lookup(self, method: str, path: str) -> dict[str, Any] | None:
+        found = self._index.get((method, path))
+        if found is None:
+            return None
+        offsets, entries = found
+        i = bisect.bisect_right(offsets, self._offset()) - 1
+        return entries[max(0, i)]
+
+    def all_device_ids(self) -> list[str]:
+        if not self._device_ids:
+            return []
+        ids = list(self._device_ids)
+        for n in range(1, self._clones + 1):
+            ids.append(f"{self._device_ids[(n - 1) % len(self._device_ids)]}{CLONE_SEP}{n}")
+        return ids
+
+    def _devices_listing(self) -> dict[str, Any]:
+        recorded = self._lookup("GET", "/devices")
+        by_id = {
+            item.get("deviceId"): item
+            for item in ((recorded or {}).get("response") or {}).get("items") or []
+        }
+        items = []
+        for dev in self.all_device_ids():
+            base = dict(by_id.get(_split_clone(dev)) or {"name": "Playback device", "components": []})
+            base["deviceId"] = dev
+            if dev != _split_clone(dev):
+                base["label"] = f"{base.get('label') or base.get('name')} #{dev.split(CLONE_SEP, 1)[1]}"
+            items.append(base)
+        return {"items": items, "_links": {}}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = request.path
+        if path.startswith("/v1/"):
+            path = path[3:]
+        if path == "/_stats":
+            return web.json_response(dict(self.stats))
+
+        if self._latency_s or self._jitter_s:
+            await asyncio.sleep(self._latency_s + self._rng.uniform(0, self._jitter_s))
+
+        roll = self._rng.random()
+        if roll < self._rate_429:
+            self.stats["429"] += 1
+            return web.json_response({"error": {"code": "TooManyRequestError"}}, status=429, headers={"Retry-After": "60"})
+        if roll < self._rate_429 + self._error_rate:
+            self.stats["503"] += 1
+            return web.json_response({"error": {"code": "ServiceUnavailable"}}, status=503)
+
+        if request.method == "GET" and path == "/devices":
+            self.stats["200"] += 1
+            return web.json_response(self._devices_listing())
+
+        parts = path.split("/")
+        if len(parts) >= 3 and parts[1] == "devices":
+            parts[2] = _split_clone(parts[2])
+        entry = self._lookup(request.method, "/".join(parts))
+        if entry is None:
+            if request.method == "POST" and path.endswith("/commands"):
+                self.stats["200"] += 1
+                return web.json_response({"results": [{"status": "ACCEPTED"}]})
+            self.stats["404"] += 1
+            return web.json_response({"error": {"code": "NotFoundError"}}, status=404)
+
+        status = int(entry.get("status") or 200)
+        self.stats[str(status)] += 1
+        return web.json_response(entry.get("response"), status=status)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        return app
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded SmartThings traffic for offline load tests.")
+    parser.add_argument("traces", help="JSONL file written in record mode")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (1 = real time)")
+    parser.add_argument("--clones", type=int, default=0, help="extra simulated devices (<device_id>~<n>)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = STPlaybackServer(
+        load_traces(args.traces),
+        speed=args.speed,
+        clones=args.clones,
+        rate_429=args.rate_429,
+        error_rate=args.error_rate,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        seed=args.seed,
+    )
+    _LOGGER.info("Replaying %s device ids at %sx", len(server.all_device_ids()), args.speed)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
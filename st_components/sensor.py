@@ -10,8 +10,10 @@ from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .const import DOMAIN
-from .coordinator import STCoordinator
+from .coordinator import STCoordinator, STEntryRuntime
 from .entity import STCEntity
+from .capabilities import SensorSpec, resolve_sensor
+from .energy import last_pcr_record, parse_pcr, to_float
 
 # ---- helpers ----
 
@@ -36,23 +38,6 @@ def _get_payload(coordinator: STCoordinator, comp_id: str, cap: str, attr: str)
 def _get_attr(coordinator: STCoordinator, comp_id: str, cap: str, attr: str) -> Any:
     return _get_payload(coordinator, comp_id, cap, attr).get("value")
 
-def _norm_to_kwh(value: Optional[float], unit: str | None) -> Optional[float]:
-    """Konwersja liczby do kWh w zależności od jednostki (Wh/kWh/None)."""
-    if value is None:
-        return None
-    try:
-        f = float(value)
-    except Exception:
-        return None
-    if not unit:
-        # Heurystyka: duże wartości zwykle Wh → zamień na kWh
-        return f / 1000.0 if f > 500 else f
-    u = unit.lower()
-    if u in ("wh", "watt-hour", "watt_hour", "watt hours", "watt_hours"):
-        return f / 1000.0
-    # jeżeli to już kWh lub coś innego – zwracamy bez zmian
-    return f
-
 def _delta_wh_from_pcr(value: Any) -> Optional[float]:
     """
     Zwraca delta energii w Wh z payloadu powerConsumptionReport.powerConsumption.
@@ -82,45 +67,28 @@ def _delta_wh_from_pcr(value: Any) -> Optional[float]:
     return f
 
 
-def _parse_pcr(value: Any) -> tuple[Optional[float], Optional[float], Optional[float]]:
-    """
-    Parse powerConsumptionReport.powerConsumption into kWh/W:
-    returns (energy_kwh, power_w, delta_kwh)
-    Accepts dict or list[dict]; picks the last record.
-    """
-    last = None
-    if isinstance(value, list) and value:
-        last = value[-1]
-    elif isinstance(value, dict):
-        last = value
-    if not isinstance(last, dict):
-        return (None, None, None)
-
-    def num(x):
-        try:
-            return float(x) if x is not None else None
-        except Exception:
-            return None
-
-    # ST bywa niespójne – sprawdzamy pola unit jeśli są
-    energy_val = num(last.get("energy"))
-    delta_val = num(last.get("deltaEnergy"))
-    power_w = num(last.get("power"))
-    energy_unit = (last.get("energyUnit") or last.get("unit") or last.get("energy_unit") or "") or None
-    delta_unit = (last.get("deltaEnergyUnit") or last.get("unit") or last.get("delta_energy_unit") or "") or None
-
-    energy_kwh = _norm_to_kwh(energy_val, energy_unit)
-    delta_kwh = _norm_to_kwh(delta_val, delta_unit)
-
-    return (energy_kwh, power_w, delta_kwh)
-
 # ---- base entities ----
 
 class STCSensor(STCEntity, SensorEntity):
-    """Generic numeric sensor (returns raw value)."""
+    """Generic numeric sensor; unit/device class resolved once from the capability registry."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._convert = None
+        unit = _get_payload(self.coordinator, self._component_id, self._capability, self._attribute).get("unit")
+        spec: SensorSpec | None = resolve_sensor(self._capability, self._attribute, unit)
+        if spec is not None:
+            self._convert = spec.converter
+            self._attr_device_class = spec.device_class
+            if spec.state_class is not None:
+                self._attr_state_class = spec.state_class
+            if spec.native_unit is not None:
+                self._attr_native_unit_of_measurement = spec.native_unit
+
     @property
     def native_value(self):
-        return self._current_attr()
+        val = self._current_attr()
+        return self._convert(val) if self._convert is not None else val
 
 # temperature
 class STCTemperatureSensor(STCSensor):
@@ -138,23 +106,30 @@ class STCPowerSensor(STCSensor):
 
 class STCPcrBase(STCEntity, SensorEntity):
     """Base for powerConsumptionReport-derived sensors."""
-    _role: str  # "energy_total" | "power" | "energy_delta"
+    _role: str  # "energy_total" | "power" | "energy_delta" (delta ma własne native_value)
 
     def __init__(self, *args, role: str, **kwargs):
         super().__init__(*args, **kwargs)
         self._role = role
+        # licznik energii: konwerter serii współdzielony ze statystykami godzinowymi
+        self._energy_conv = self.coordinator.energy_converter(
+            self._component_id, "powerConsumptionReport", "powerConsumption"
+        )
 
-    @property
-    def native_value(self):
+    def _last_record(self) -> dict | None:
         raw = _get_attr(self.coordinator, self._component_id,
                         "powerConsumptionReport", "powerConsumption")
-        energy_kwh, power_w, delta_kwh = _parse_pcr(raw)
+        return last_pcr_record(raw)
+
+    @property
+    def native_value(self):
+        last = self._last_record()
+        if last is None:
+            return None
         if self._role == "energy_total":
-            return energy_kwh  # kWh
+            return parse_pcr(last, self._energy_conv)[0]  # kWh
         if self._role == "power":
-            return power_w     # W
-        if self._role == "energy_delta":
-            return delta_kwh   # kWh
+            return to_float(last.get("power"))  # W
         return None
 
 class STCPcrEnergyTotal(STCPcrBase):
@@ -189,12 +164,15 @@ class STCEnergyTotalFromEnergyMeter(STCEntity, SensorEntity):
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
     _attr_state_class = SensorStateClass.TOTAL_INCREASING
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # jednostka z payloadu ("Wh"/"kWh"), a gdy jej brak – ze schematu capability
+        self._convert = self.coordinator.energy_converter(self._component_id, "energyMeter", "energy")
+
     @property
     def native_value(self):
         payload = _get_payload(self.coordinator, self._component_id, "energyMeter", "energy")
-        value = payload.get("value")
-        unit = payload.get("unit")  # spodziewane "Wh" lub "kWh"
-        return _norm_to_kwh(value, unit)
+        return self._convert(payload.get("value"), payload.get("unit"))
 
 # ---- setup ----
 
@@ -209,10 +187,7 @@ NUMERIC_SKIP = {
     ("powerMeter", "power"),
 }
 
-async def async_setup_entry(
-    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
-) -> None:
-    coord: STCoordinator = hass.data[DOMAIN][entry.entry_id]
+def _build_entities(coord: STCoordinator) -> list[SensorEntity]:
     data = coord.data or {}
     entities: list[SensorEntity] = []
 
@@ -269,11 +244,26 @@ async def async_setup_entry(
     for comp_id, cap, attr in _iter_components(data):
         if (cap, attr) in NUMERIC_SKIP or (cap, attr) == (TEMPERATURE_CAP, TEMPERATURE_ATTR):
             continue
-        val = _get_attr(coord, comp_id, cap, attr)
-        if isinstance(val, (int, float)):
+        kind = coord.attribute_type(cap, attr)
+        if kind is not None:
+            numeric = kind in ("number", "integer")
+        else:
+            # brak definicji capability → zgadujemy po bieżącej wartości
+            numeric = isinstance(_get_attr(coord, comp_id, cap, attr), (int, float))
+        if numeric:
             name = f"ST {comp_id} {cap}.{attr}"
             uid = f"{coord.device_id}-{comp_id}-{cap}-{attr}"
             entities.append(STCSensor(coord, comp_id, cap, attr, name, uid))
 
+    return entities
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> None:
+    runtime: STEntryRuntime = hass.data[DOMAIN][entry.entry_id]
+    entities: list[SensorEntity] = []
+    for coord in runtime.coordinators.values():
+        entities.extend(_build_entities(coord))
+
     if entities:
         async_add_entities(entities, update_before_add=True)
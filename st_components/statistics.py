@@ -0,0 +1,188 @@
+"""Hourly long-term statistics import for powerConsumptionReport data."""
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+import logging
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData, StatisticMeanType
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+)
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .energy import EnergyConverter, last_pcr_record, parse_pcr
+
+_LOGGER = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+
+
+def _parse_iso(ts: str | None) -> datetime | None:
+    if not ts:
+        return None
+    try:
+        if ts.endswith("Z"):
+            return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        return datetime.fromisoformat(ts)
+    except Exception:
+        return None
+
+
+def _hour_start(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def statistic_id_for(device_id: str, component_id: str) -> str:
+    """Identyfikator zewnętrznej statystyki: st_components:energy_<device>_<component>."""
+    slug = f"energy_{device_id}_{component_id}".lower()
+    slug = "".join(ch if ch.isalnum() else "_" for ch in slug)
+    while "__" in slug:
+        slug = slug.replace("__", "_")
+    slug = slug.strip("_")
+    return f"{DOMAIN}:{slug}"
+
+
+class _EnergySeries:
+    """Stan jednej serii godzinowej (jeden komponent z PCR)."""
+
+    def __init__(self, statistic_id: str, name: str):
+        self.statistic_id = statistic_id
+        self.name = name
+        self.loaded = False
+        # Ostatnia zapisana godzina (z recordera lub z naszego zapisu)
+        self.last_sum: float = 0.0
+        self.last_state: float | None = None
+        # Godzina otwarta: ostatni odczyt licznika w bieżącej godzinie i jego czas
+        self.open_hour: datetime | None = None
+        self.open_state: float | None = None
+        self.open_at: datetime | None = None
+        self.open_written = False
+
+    def _row(self, hour: datetime, state: float) -> StatisticData:
+        if self.last_state is not None:
+            # Reset licznika (np. po restarcie urządzenia) nie zmniejsza sumy
+            self.last_sum += max(0.0, state - self.last_state)
+        self.last_state = state
+        return StatisticData(start=hour, state=state, sum=self.last_sum)
+
+    def feed(self, end: datetime, energy_kwh: float) -> list[StatisticData]:
+        """Dodaj odczyt; zwraca wiersze dla godzin, które właśnie się zamknęły (z uzupełnionymi lukami)."""
+        hour = _hour_start(end)
+        if self.open_hour is None:
+            self.open_hour, self.open_state, self.open_at, self.open_written = hour, energy_kwh, end, False
+            return []
+        if hour < self.open_hour:
+            return []
+        if hour == self.open_hour:
+            if not self.open_written:
+                self.open_state, self.open_at = energy_kwh, end
+            return []
+
+        rows: list[StatisticData] = []
+        prev_at, prev_state = self.open_at, self.open_state
+        if prev_at is not None and prev_state is not None:
+            # Stan licznika na końcu każdej zamkniętej godziny: interpolacja liniowa od ostatniego
+            # odczytu (prev_at) do bieżącego – zużycie z końcówki godziny zostaje w tej godzinie,
+            # a luki (awaria, cooldown 429) dostają swoją część
+            span_s = (end - prev_at).total_seconds()
+            closing = self.open_hour + HOUR if self.open_written else self.open_hour
+            while closing < hour:
+                boundary = closing + HOUR
+                frac = 1.0 if span_s <= 0 else min(1.0, max(0.0, (boundary - prev_at).total_seconds() / span_s))
+                rows.append(self._row(closing, prev_state + (energy_kwh - prev_state) * frac))
+                closing = boundary
+
+        self.open_hour, self.open_state, self.open_at, self.open_written = hour, energy_kwh, end, False
+        return rows
+
+
+class STStatisticsWriter:
+    """Zamienia okna powerConsumptionReport na godzinowe statystyki i wstawia je paczkami do recordera."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        device_id: str,
+        energy_converter: Callable[[str, str, str], EnergyConverter],
+    ):
+        self._hass = hass
+        self._device_id = device_id
+        # ten sam konwerter Wh/kWh co encja licznika PCR danego komponentu
+        self._energy_converter = energy_converter
+        self._series: dict[str, _EnergySeries] = {}
+
+    async def _async_load(self, series: _EnergySeries) -> None:
+        """Wczytaj ostatni zapisany wiersz, żeby po restarcie kontynuować sumę i uzupełnić lukę."""
+        series.loaded = True
+        try:
+            last = await get_instance(self._hass).async_add_executor_job(
+                get_last_statistics, self._hass, 1, series.statistic_id, True, {"state", "sum"}
+            )
+        except Exception as err:
+            _LOGGER.debug("Could not read last statistics for %s: %s", series.statistic_id, err)
+            return
+        rows = last.get(series.statistic_id) or []
+        if not rows:
+            return
+        row = rows[0]
+        start = row.get("start")
+        if isinstance(start, (int, float)):
+            start = datetime.fromtimestamp(start, tz=timezone.utc)
+        if not isinstance(start, datetime):
+            return
+        series.last_sum = float(row.get("sum") or 0.0)
+        series.last_state = row.get("state")
+        series.open_hour = start
+        series.open_state = series.last_state
+        # zapisany wiersz niesie stan z końca swojej godziny
+        series.open_at = start + HOUR
+        series.open_written = True
+
+    async def async_process(self, data: dict[str, Any]) -> None:
+        """Przetwórz snapshot /status i wstaw zamknięte godziny jednym wywołaniem na serię."""
+        if "recorder" not in self._hass.config.components:
+            return
+        comps = (data or {}).get("components") or {}
+        for comp_id, caps in comps.items():
+            payload = ((caps or {}).get("powerConsumptionReport") or {}).get("powerConsumption") or {}
+            last = last_pcr_record(payload.get("value"))
+            if last is None:
+                continue
+            end = _parse_iso(last.get("end"))
+            conv = self._energy_converter(comp_id, "powerConsumptionReport", "powerConsumption")
+            energy_kwh, _power = parse_pcr(last, conv)
+            if end is None or energy_kwh is None:
+                continue
+
+            series = self._series.get(comp_id)
+            if series is None:
+                series = _EnergySeries(
+                    statistic_id_for(self._device_id, comp_id),
+                    f"ST {comp_id} energy (hourly)",
+                )
+                self._series[comp_id] = series
+            if not series.loaded:
+                await self._async_load(series)
+
+            rows = series.feed(end, energy_kwh)
+            if not rows:
+                continue
+
+            metadata = StatisticMetaData(
+                has_mean=False,
+                mean_type=StatisticMeanType.NONE,
+                has_sum=True,
+                name=series.name,
+                source=DOMAIN,
+                statistic_id=series.statistic_id,
+                unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+            )
+            _LOGGER.debug(
+                "Importing %s hourly statistics rows for %s (%s → %s)",
+                len(rows), series.statistic_id, rows[0]["start"], rows[-1]["start"],
+            )
+            async_add_external_statistics(self._hass, metadata, rows)
@@ -0,0 +1,143 @@
+"""Subskrypcje zmian pojedynczych atrybutów (component, capability, attribute) w snapshotach /status."""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+from fnmatch import fnmatchcase
+from typing import Any, Callable
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+AttributeKey = tuple[str, str, str]
+
+
+@dataclass(frozen=True)
+class STAttributeChange:
+    """Zmiana wartości jednego atrybutu między kolejnymi snapshotami."""
+
+    device_id: str
+    component: str
+    capability: str
+    attribute: str
+    old_value: Any
+    new_value: Any
+    timestamp: datetime
+
+    @property
+    def key(self) -> AttributeKey:
+        return (self.component, self.capability, self.attribute)
+
+    def as_event_data(self) -> dict[str, Any]:
+        return {
+            "device_id": self.device_id,
+            "component": self.component,
+            "capability": self.capability,
+            "attribute": self.attribute,
+            "old_value": self.old_value,
+            "new_value": self.new_value,
+            "timestamp": self.timestamp.isoformat(),
+        }
+
+
+ChangeCallback = Callable[[STAttributeChange], None]
+
+
+def _is_pattern(part: str) -> bool:
+    return any(ch in part for ch in "*?[")
+
+
+def parse_key(text: str) -> AttributeKey | None:
+    """"component/capability/attribute" (dozwolone wzorce fnmatch, np. "*/contactSensor/*")."""
+    parts = [p.strip() for p in text.strip().split("/")]
+    if len(parts) != 3 or not all(parts):
+        return None
+    return (parts[0], parts[1], parts[2])
+
+
+def matches(key: AttributeKey, patterns: list[AttributeKey]) -> bool:
+    return any(
+        fnmatchcase(key[0], p[0]) and fnmatchcase(key[1], p[1]) and fnmatchcase(key[2], p[2])
+        for p in patterns
+    )
+
+
+def _value(data: dict[str, Any] | None, key: AttributeKey) -> tuple[bool, Any]:
+    comp, cap, attr = key
+    payload = ((((data or {}).get("components") or {}).get(comp) or {}).get(cap) or {}).get(attr)
+    if not isinstance(payload, dict) or "value" not in payload:
+        return (False, None)
+    return (True, payload.get("value"))
+
+
+class STSubscriptions:
+    """Rejestr subskrybentów: klucze dokładne (lookup w dict) i wzorce (fnmatch)."""
+
+    def __init__(self) -> None:
+        self._exact: dict[AttributeKey, list[ChangeCallback]] = {}
+        self._patterns: list[tuple[AttributeKey, ChangeCallback]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self._exact or self._patterns)
+
+    def subscribe(self, key: AttributeKey, callback: ChangeCallback) -> Callable[[], None]:
+        if any(_is_pattern(part) for part in key):
+            item = (key, callback)
+            self._patterns.append(item)
+
+            def _remove_pattern() -> None:
+                if item in self._patterns:
+                    self._patterns.remove(item)
+
+            return _remove_pattern
+
+        self._exact.setdefault(key, []).append(callback)
+
+        def _remove_exact() -> None:
+            callbacks = self._exact.get(key) or []
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._exact.pop(key, None)
+
+        return _remove_exact
+
+    def diff(
+        self,
+        device_id: str,
+        old: dict[str, Any] | None,
+        new: dict[str, Any] | None,
+        timestamp: datetime,
+        extra_patterns: list[AttributeKey] | None = None,
+    ) -> list[STAttributeChange]:
+        """Zmiany dla kluczy, które ktoś obserwuje. Bez wzorców sprawdzamy tylko klucze dokładne."""
+        patterns = [key for key, _cb in self._patterns] + list(extra_patterns or [])
+        changes: list[STAttributeChange] = []
+
+        def _check(key: AttributeKey) -> None:
+            had_old, old_val = _value(old, key)
+            has_new, new_val = _value(new, key)
+            if has_new and (not had_old or old_val != new_val):
+                changes.append(STAttributeChange(device_id, *key, old_val, new_val, timestamp))
+
+        if not patterns:
+            for key in self._exact:
+                _check(key)
+            return changes
+
+        for comp, caps in ((new or {}).get("components") or {}).items():
+            for cap, attrs in (caps or {}).items():
+                for attr in attrs or {}:
+                    key = (comp, cap, attr)
+                    if key in self._exact or matches(key, patterns):
+                        _check(key)
+        return changes
+
+    def dispatch(self, changes: list[STAttributeChange]) -> None:
+        for change in changes:
+            callbacks = list(self._exact.get(change.key) or [])
+            callbacks += [cb for p, cb in self._patterns if matches(change.key, [p])]
+            for cb in callbacks:
+                try:
+                    cb(change)
+                except Exception:
+                    _LOGGER.exception("Error in st_components subscriber for %s", change.key)
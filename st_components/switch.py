@@ -5,10 +5,29 @@ from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .const import DOMAIN
-from .coordinator import STCoordinator
+from .coordinator import STCoordinator, STEntryRuntime
 from .entity import STCEntity
 
+_STATE_ENUM = {"on", "off", "active", "inactive", "activated", "deactivated", "true", "false"}
+
+
+def _state_attribute(coord: STCoordinator, cap_name: str, attrs: dict) -> str:
+    """Atrybut niosący stan wg definicji capability; bez definicji – pierwszy atrybut."""
+    schema = coord.capabilities
+    if schema is not None:
+        for attr_name in attrs:
+            spec = schema.attribute(cap_name, attr_name) or {}
+            if spec.get("type") == "boolean" or _STATE_ENUM.intersection(map(str.lower, spec.get("enum") or [])):
+                return attr_name
+    return next(iter(attrs.keys()), "state")
+
+
 class STCPowerModeSwitch(STCEntity, SwitchEntity):
+    def __init__(self, *args, on_command: str = "activate", off_command: str = "deactivate", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_command = on_command
+        self._off_command = off_command
+
     @property
     def is_on(self) -> bool:
         val = self._current_attr()
@@ -19,24 +38,36 @@ class STCPowerModeSwitch(STCEntity, SwitchEntity):
         return bool(val)
 
     async def async_turn_on(self, **kwargs) -> None:
-        await self._send(self._capability, "activate", [])
+        await self._send(self._capability, self._on_command, [])
 
     async def async_turn_off(self, **kwargs) -> None:
-        await self._send(self._capability, "deactivate", [])
+        await self._send(self._capability, self._off_command, [])
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
-    coord: STCoordinator = hass.data[DOMAIN][entry.entry_id]
+def _build_entities(coord: STCoordinator) -> list[SwitchEntity]:
     entities: list[SwitchEntity] = []
     comps = (coord.data or {}).get("components") or {}
 
     for comp_id, caps in comps.items():
         for cap_name, attrs in (caps or {}).items():
             if cap_name.endswith("powerCool") or cap_name.endswith("powerFreeze"):
-                # choose an attribute carrying state if exists
-                attr_name = next(iter(attrs.keys()), "state")
+                attr_name = _state_attribute(coord, cap_name, attrs or {})
+                commands = coord.capabilities.commands(cap_name) if coord.capabilities is not None else []
+                on_off = ("on", "off") if {"on", "off"} <= set(commands) and "activate" not in commands else ("activate", "deactivate")
                 name = f"ST {comp_id} {cap_name}"
-                uid = f"{coord.device_id}-{comp_id}-{cap_name}-{attr_name}"
-                entities.append(STCPowerModeSwitch(coord, comp_id, cap_name, attr_name, name, uid))
+                # unique_id zostaje przy pierwszym atrybucie (jak w starszych wersjach), żeby nie dublować encji
+                uid = f"{coord.device_id}-{comp_id}-{cap_name}-{next(iter((attrs or {}).keys()), 'state')}"
+                entities.append(STCPowerModeSwitch(
+                    coord, comp_id, cap_name, attr_name, name, uid,
+                    on_command=on_off[0], off_command=on_off[1],
+                ))
+
+    return entities
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
+    runtime: STEntryRuntime = hass.data[DOMAIN][entry.entry_id]
+    entities: list[SwitchEntity] = []
+    for coord in runtime.coordinators.values():
+        entities.extend(_build_entities(coord))
 
     if entities:
         async_add_entities(entities, update_before_add=True)
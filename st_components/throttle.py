@@ -0,0 +1,54 @@
+"""Polityki ograniczania zapisów stanu (min. odstęp, martwa strefa, wymuszony zapis po max. wieku)."""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class WritePolicy:
+    min_interval_s: float = 0.0
+    abs_delta: float = 0.0
+    rel_delta: float = 0.0
+    max_age_s: float = 0.0
+
+    def significant(self, old: Any, new: Any) -> bool:
+        """Czy zmiana przekracza martwą strefę (bez progów – każda zmiana jest istotna)."""
+        if old == new:
+            return False
+        if not _is_number(old) or not _is_number(new):
+            return True
+        if self.abs_delta <= 0 and self.rel_delta <= 0:
+            return True
+        diff = abs(float(new) - float(old))
+        if self.abs_delta > 0 and diff >= self.abs_delta:
+            return True
+        return self.rel_delta > 0 and diff >= self.rel_delta * abs(float(old))
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_policies(text: str) -> dict[str, WritePolicy]:
+    """"capability:min_interval_s:abs_delta:rel_delta:max_age_s", rozdzielone przecinkami lub nowymi liniami."""
+    policies: dict[str, WritePolicy] = {}
+    for part in (text or "").replace("\n", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        cap, _, rest = part.partition(":")
+        try:
+            nums = [float(x) for x in rest.split(":")] if rest else []
+            if not cap or len(nums) > 4 or any(n < 0 for n in nums):
+                raise ValueError
+        except ValueError:
+            _LOGGER.warning(
+                "Ignoring invalid write throttle %r (expected capability:min_interval:abs:rel:max_age)", part
+            )
+            continue
+        nums += [0.0] * (4 - len(nums))
+        policies[cap.strip()] = WritePolicy(*nums)
+    return policies